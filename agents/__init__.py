@@ -2,5 +2,6 @@
 from .github_agent import GitHubAgent
 from .analysis_agent import AnalysisAgent
 from .prd_agent import PRDAgent
+from .clients import get_github_client, get_http_session, get_llm
 
-__all__ = ["GitHubAgent", "AnalysisAgent", "PRDAgent"]
+__all__ = ["GitHubAgent", "AnalysisAgent", "PRDAgent", "get_github_client", "get_http_session", "get_llm"]
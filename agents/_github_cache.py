@@ -0,0 +1,98 @@
+import asyncio
+import logging
+from dataclasses import dataclass, field
+from itertools import islice
+from typing import Dict, List, Optional
+from cachetools import TTLCache
+from config import settings
+from .clients import get_github_client, paced_github_items, throttle_github_request
+
+@dataclass
+class RepoSnapshot:
+    """Repository data fetched once and shared by every agent"""
+    stats: Dict
+    issues: List[Dict] = field(default_factory=list)
+    commits: List[Dict] = field(default_factory=list)
+
+_snapshots = TTLCache(maxsize=16, ttl=settings.github_snapshot_ttl_seconds)
+_pending: Dict[str, asyncio.Future] = {}
+
+async def get_snapshot(repo_full_name: str) -> Optional[RepoSnapshot]:
+    """Return a cached snapshot of the repository, fetching it at most once per TTL"""
+    snapshot = _snapshots.get(repo_full_name)
+    if snapshot is not None:
+        return snapshot
+    
+    # Concurrent callers share the in-flight fetch instead of starting their own
+    pending = _pending.get(repo_full_name)
+    if pending is None:
+        pending = asyncio.ensure_future(asyncio.to_thread(_fetch_snapshot, repo_full_name))
+        _pending[repo_full_name] = pending
+        try:
+            snapshot = await pending
+        finally:
+            del _pending[repo_full_name]
+        if snapshot is not None:
+            _snapshots[repo_full_name] = snapshot
+        return snapshot
+    
+    return await pending
+
+def _fetch_snapshot(repo_full_name: str) -> Optional[RepoSnapshot]:
+    """Blocking snapshot fetch, run in a worker thread"""
+    github = get_github_client()
+    if not github:
+        return None
+    
+    try:
+        throttle_github_request()
+        repo = github.get_repo(repo_full_name)
+        stats = {
+            'name': repo.name,
+            'full_name': repo.full_name,
+            'description': repo.description,
+            'stars': repo.stargazers_count,
+            'forks': repo.forks_count,
+            'open_issues': repo.open_issues_count,
+            'language': repo.language,
+            'size': repo.size,
+            'created_at': repo.created_at.isoformat(),
+            'updated_at': repo.updated_at.isoformat(),
+            'default_branch': repo.default_branch
+        }
+    except Exception as e:
+        logging.error(f"Error fetching repository {repo_full_name}: {e}")
+        return None
+    
+    issues = []
+    try:
+        # islice stops PyGithub paginating once the limit is reached
+        for issue in islice(paced_github_items(repo.get_issues(state='all')), 50):  # Limit to 50
+            issues.append({
+                'number': issue.number,
+                'title': issue.title,
+                'body': issue.body[:500] if issue.body else '',
+                'labels': [label.name for label in issue.labels],
+                'state': issue.state
+            })
+    except Exception as e:
+        logging.warning(f"Could not fetch issues: {e}")
+    
+    commits = []
+    try:
+        for commit in islice(paced_github_items(repo.get_commits()), 20):  # Limit to 20
+            # Populated from the listing payload; resolve the chain once per commit
+            git_commit = commit.commit
+            author = git_commit.author
+            commits.append({
+                'message': git_commit.message,
+                'author': author.name,
+                'date': author.date.isoformat()
+            })
+    except Exception as e:
+        if "empty" in str(e).lower():
+            logging.info("Repository is empty - no commits available")
+        else:
+            logging.warning(f"Could not fetch commits: {e}")
+    
+    return RepoSnapshot(stats=stats, issues=issues, commits=commits)
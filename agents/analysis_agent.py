@@ -1,12 +1,17 @@
 import asyncio
 import logging
-from typing import Dict, List, Any, Optional
+import operator
+import orjson
+from typing import Dict, List, Any, Optional, Tuple
 from datetime import datetime, timedelta
-from langchain_google_genai import ChatGoogleGenerativeAI
-from langchain.schema import HumanMessage
+from langchain.prompts import ChatPromptTemplate
+from langchain.schema import HumanMessage, SystemMessage
 from pydantic import BaseModel
-from github import Github
 from config import settings
+from .clients import get_github_client, get_llm, with_structured_output
+from .cache import llm_response_cache, prompt_cache_key
+from ._github_cache import get_snapshot
+from .rate_limit import ainvoke_with_retry, astream_text_with_retry
 
 class AnalysisResult(BaseModel):
     goals: List[str]
@@ -16,14 +21,17 @@ class AnalysisResult(BaseModel):
     impact_analysis: Dict[str, Any]
     recommendations: List[str]
 
+_role_and_analysis = operator.itemgetter('role', 'analysis')
+
+ANALYST_HUMAN_TEMPLATE = "Analyze this {kind} data:\n{data}"
+
+def _serialize_for_prompt(data: Dict) -> str:
+    """Serialize prompt data as compact JSON rather than a Python repr"""
+    return orjson.dumps(data, default=str).decode()
+
 class ProductAnalyst:
     """Sub-agent for product analysis"""
-    def __init__(self, llm):
-        self.llm = llm
-        self.role = "Product Analyst"
-    
-    async def analyze_requirements(self, data: Dict) -> Dict:
-        system_prompt = f"""You are a {self.role}. Analyze the provided product data and identify:
+    SYSTEM_TEMPLATE = """You are a {role}. Analyze the provided product data and identify:
 1. Core product goals and objectives
 2. Key constraints and limitations
 3. Potential edge cases and risks
@@ -31,23 +39,24 @@ class ProductAnalyst:
 
 Focus on business value, user needs, and market positioning."""
 
-        human_prompt = f"Analyze this product data: {data}"
-        
-        messages = [
-            HumanMessage(content=f"{system_prompt}\n\n{human_prompt}")
-        ]
-        
-        response = await self.llm.ainvoke(messages)
-        return {"role": self.role, "analysis": response.content}
-
-class TechnicalAnalyst:
-    """Sub-agent for technical analysis"""
     def __init__(self, llm):
         self.llm = llm
-        self.role = "Technical Analyst"
+        self.role = "Product Analyst"
+        self.kind = "product"
+        self.system_prompt = self.SYSTEM_TEMPLATE.format(role=self.role)
+        self._template = ChatPromptTemplate.from_messages([
+            ("system", self.system_prompt),
+            ("human", ANALYST_HUMAN_TEMPLATE)
+        ]).partial(kind=self.kind)
+        self._chain = self._template | self.llm
     
     async def analyze_requirements(self, data: Dict) -> Dict:
-        system_prompt = f"""You are a {self.role}. Analyze the provided data for:
+        analysis = await astream_text_with_retry(self._chain, {"data": _serialize_for_prompt(data)})
+        return {"role": self.role, "analysis": analysis}
+
+class TechnicalAnalyst:
+    """Sub-agent for technical analysis"""
+    SYSTEM_TEMPLATE = """You are a {role}. Analyze the provided data for:
 1. Technical feasibility and constraints
 2. Architecture considerations
 3. Performance and scalability issues
@@ -56,140 +65,179 @@ class TechnicalAnalyst:
 
 Focus on technical implementation details and system design."""
 
-        human_prompt = f"Analyze this technical data: {data}"
-        
-        messages = [
-            HumanMessage(content=f"{system_prompt}\n\n{human_prompt}")
-        ]
-        
-        response = await self.llm.ainvoke(messages)
-        return {"role": self.role, "analysis": response.content}
+    def __init__(self, llm):
+        self.llm = llm
+        self.role = "Technical Analyst"
+        self.kind = "technical"
+        self.system_prompt = self.SYSTEM_TEMPLATE.format(role=self.role)
+        self._template = ChatPromptTemplate.from_messages([
+            ("system", self.system_prompt),
+            ("human", ANALYST_HUMAN_TEMPLATE)
+        ]).partial(kind=self.kind)
+        self._chain = self._template | self.llm
+    
+    async def analyze_requirements(self, data: Dict) -> Dict:
+        analysis = await astream_text_with_retry(self._chain, {"data": _serialize_for_prompt(data)})
+        return {"role": self.role, "analysis": analysis}
 
 class BusinessAnalyst:
     """Sub-agent for business impact analysis"""
+    SYSTEM_TEMPLATE = """You are a {role}. Analyze the business impact including:
+1. Revenue impact and monetization opportunities
+2. Cost implications and resource requirements
+3. Market positioning and competitive advantage
+4. Risk assessment and mitigation strategies
+5. ROI projections and success metrics
+
+Focus on business outcomes and financial implications."""
+
     def __init__(self, llm):
         self.llm = llm
         self.role = "Business Analyst"
+        self.kind = "business"
+        self.system_prompt = self.SYSTEM_TEMPLATE.format(role=self.role)
+        self._template = ChatPromptTemplate.from_messages([
+            ("system", self.system_prompt),
+            ("human", ANALYST_HUMAN_TEMPLATE)
+        ]).partial(kind=self.kind)
+        self._chain = self._template | self.llm
     
     async def analyze_requirements(self, data: Dict) -> Dict:
-        system_prompt = f"""You are a {self.role}. Analyze the business impact including:
+        analysis = await astream_text_with_retry(self._chain, {"data": _serialize_for_prompt(data)})
+        return {"role": self.role, "analysis": analysis}
+
+class CombinedAnalysis(BaseModel):
+    product: str
+    technical: str
+    business: str
+
+class CombinedAnalysts:
+    """Runs the product, technical, and business analyses in a single LLM call"""
+    SYSTEM_TEMPLATE = """You are a team of three specialists analyzing the same data. Write one analysis per role.
+
+product - Product Analyst. Identify:
+1. Core product goals and objectives
+2. Key constraints and limitations
+3. Potential edge cases and risks
+4. Strategic recommendations
+Focus on business value, user needs, and market positioning.
+
+technical - Technical Analyst. Analyze:
+1. Technical feasibility and constraints
+2. Architecture considerations
+3. Performance and scalability issues
+4. Integration challenges
+5. Security and compliance requirements
+Focus on technical implementation details and system design.
+
+business - Business Analyst. Analyze the business impact including:
 1. Revenue impact and monetization opportunities
 2. Cost implications and resource requirements
 3. Market positioning and competitive advantage
 4. Risk assessment and mitigation strategies
 5. ROI projections and success metrics
-
 Focus on business outcomes and financial implications."""
 
-        human_prompt = f"Analyze this business data: {data}"
-        
-        messages = [
-            HumanMessage(content=f"{system_prompt}\n\n{human_prompt}")
-        ]
-        
-        response = await self.llm.ainvoke(messages)
-        return {"role": self.role, "analysis": response.content}
+    def __init__(self, llm):
+        self._template = ChatPromptTemplate.from_messages([
+            ("system", self.SYSTEM_TEMPLATE),
+            ("human", "Analyze this data:\n{data}")
+        ])
+        self._chain = self._template | with_structured_output(llm, CombinedAnalysis)
+    
+    async def analyze_requirements(self, data: Dict) -> Dict:
+        result = await ainvoke_with_retry(self._chain, {"data": _serialize_for_prompt(data)})
+        return result.model_dump()
 
 class AnalysisAgent:
     """Agent 2: AI Analysis agent for product requirement analysis"""
     
-    def __init__(self):
-        self.llm = ChatGoogleGenerativeAI(
-            model="gemini-2.0-flash",
-            google_api_key=settings.google_api_key,
-            temperature=0.3,
-            convert_system_message_to_human=True
-        )
+    def __init__(self, llm_semaphore: Optional[asyncio.Semaphore] = None):
+        self.llm = get_llm(0.3)
+        
+        # Synthesis returns an AnalysisResult directly instead of free-form text
+        self.structured_llm = with_structured_output(self.llm, AnalysisResult)
         
         # Initialize sub-agents
         self.product_analyst = ProductAnalyst(self.llm)
         self.technical_analyst = TechnicalAnalyst(self.llm)
         self.business_analyst = BusinessAnalyst(self.llm)
+        self.combined_analysts = CombinedAnalysts(self.llm)
         
         # Initialize data source clients
-        self.github = Github(settings.github_token) if settings.github_token else None
+        self.github = get_github_client()
+        
+        # Bound concurrent LLM calls to stay within Gemini rate limits; shared when injected
+        self._llm_semaphore = llm_semaphore or asyncio.Semaphore(settings.max_concurrent_llm)
     
     async def fetch_github_data(self) -> Dict:
         """Fetch data from GitHub repository"""
         if not self.github or not settings.github_repo_owner or not settings.github_repo_name:
             return {}
         
-        try:
-            repo = self.github.get_repo(f"{settings.github_repo_owner}/{settings.github_repo_name}")
-            
-            # Get issues and pull requests
-            issues = []
-            try:
-                issue_list = list(repo.get_issues(state='all'))
-                for issue in issue_list[:50]:  # Limit to 50
-                    issues.append({
-                        'number': issue.number,
-                        'title': issue.title,
-                        'body': issue.body[:500] if issue.body else '',
-                        'labels': [label.name for label in issue.labels],
-                        'state': issue.state,
-                        'created_at': issue.created_at.isoformat()
-                    })
-            except Exception as e:
-                logging.warning(f"Could not fetch issues: {e}")
-            
-            # Get recent commits
-            commits = []
-            try:
-                commit_list = list(repo.get_commits())
-                for commit in commit_list[:20]:  # Limit to 20
-                    commits.append({
-                        'message': commit.commit.message,
-                        'author': commit.commit.author.name,
-                        'date': commit.commit.author.date.isoformat()
-                    })
-            except Exception as e:
-                if "empty" in str(e).lower():
-                    logging.info("Repository is empty - no commits available")
-                else:
-                    logging.warning(f"Could not fetch commits: {e}")
-            
-            return {
-                'source': 'github',
-                'repository': repo.full_name,
-                'description': repo.description or "No description available",
-                'issues': issues,
-                'commits': commits,
-                'language': repo.language,
-                'stars': repo.stargazers_count
-            }
-        except Exception as e:
-            logging.error(f"Error fetching GitHub data: {e}")
+        snapshot = await get_snapshot(f"{settings.github_repo_owner}/{settings.github_repo_name}")
+        if not snapshot:
             return {}
+        
+        return {
+            'source': 'github',
+            'repository': snapshot.stats['full_name'],
+            'description': snapshot.stats['description'] or "No description available",
+            'issues': snapshot.issues,
+            'commits': snapshot.commits,
+            'language': snapshot.stats['language'],
+            'stars': snapshot.stats['stars']
+        }
     
     async def gather_all_data(self) -> Dict:
         """Gather data from all available sources"""
         data_sources = {}
         
         # Fetch from all sources concurrently
-        github_task = asyncio.create_task(self.fetch_github_data())
-        
-        github_data = await github_task
+        sources = {
+            'github': self.fetch_github_data(),
+        }
+        results = await asyncio.gather(*sources.values(), return_exceptions=True)
         
-        if github_data:
-            data_sources['github'] = github_data
+        for name, result in zip(sources.keys(), results):
+            if isinstance(result, Exception):
+                logging.error(f"Error fetching {name} data: {result}")
+            elif result:
+                data_sources[name] = result
         
         return data_sources
     
+    async def _run_analyst(self, index: int, analyst, data: Dict) -> Tuple[int, Dict]:
+        """Run a single sub-agent within the LLM concurrency limit"""
+        try:
+            async with self._llm_semaphore:
+                return index, await analyst.analyze_requirements(data)
+        except Exception as e:
+            logging.error(f"Error in {analyst.role} analysis: {e}")
+            return index, {"role": analyst.role, "analysis": "Analysis unavailable due to an error."}
+    
     async def run_multi_agent_analysis(self, data: Dict) -> List[Dict]:
         """Run analysis using multiple specialized agents"""
-        analyses = []
-        
-        # Run all agents concurrently
-        product_task = asyncio.create_task(self.product_analyst.analyze_requirements(data))
-        technical_task = asyncio.create_task(self.technical_analyst.analyze_requirements(data))
-        business_task = asyncio.create_task(self.business_analyst.analyze_requirements(data))
+        analysts = [self.product_analyst, self.technical_analyst, self.business_analyst]
         
-        product_analysis = await product_task
-        technical_analysis = await technical_task
-        business_analysis = await business_task
+        # One structured call covers all three roles; fall back to per-analyst calls
+        try:
+            async with self._llm_semaphore:
+                combined = await self.combined_analysts.analyze_requirements(data)
+            return [
+                {"role": analyst.role, "analysis": combined[key]}
+                for key, analyst in zip(("product", "technical", "business"), analysts)
+            ]
+        except Exception as e:
+            logging.warning(f"Combined analysis failed, running analysts individually: {e}")
         
-        analyses.extend([product_analysis, technical_analysis, business_analysis])
+        # Run all agents concurrently, collecting each analysis as soon as it finishes
+        analyses = [None] * len(analysts)
+        tasks = [self._run_analyst(index, analyst, data) for index, analyst in enumerate(analysts)]
+        for next_done in asyncio.as_completed(tasks):
+            index, analysis = await next_done
+            analyses[index] = analysis
+            logging.info(f"{analysis['role']} analysis ready")
         
         return analyses
     
@@ -206,85 +254,39 @@ Based on the provided analyses from Product Analyst, Technical Analyst, and Busi
 5. IMPACT_ANALYSIS: Detailed impact on growth, revenue, user experience, and technical debt
 6. RECOMMENDATIONS: Prioritized action items
 
-Format your response as a structured analysis with clear sections."""
+Return impact_analysis as short assessments keyed by growth_potential, revenue_impact, user_experience, and technical_debt."""
 
-        analyses_text = "\n\n".join([f"**{analysis['role']}:**\n{analysis['analysis']}" for analysis in analyses])
+        analyses_text = "\n\n".join(f"**{role}:**\n{analysis}" for role, analysis in map(_role_and_analysis, analyses))
         
-        human_prompt = f"""Synthesize the following analyses into a comprehensive product requirements analysis:
-
-{analyses_text}
+        # Fixed instructions first and the per-run analyses last, so repeated prompts share a prefix
+        human_prompt = f"""Synthesize the following analyses into a comprehensive product requirements analysis.
+Provide a structured synthesis covering goals, constraints, edge cases, follow-up questions, impact analysis, and recommendations.
 
 Original Data Sources: {list(data.keys())}
 
-Provide a structured synthesis covering goals, constraints, edge cases, follow-up questions, impact analysis, and recommendations."""
+{analyses_text}"""
 
         messages = [
-            HumanMessage(content=f"{system_prompt}\n\n{human_prompt}")
+            SystemMessage(content=system_prompt),
+            HumanMessage(content=human_prompt)
         ]
         
+        cache_key = prompt_cache_key(system_prompt, human_prompt)
+        cached = llm_response_cache.get(cache_key)
+        if cached is not None:
+            return cached.model_copy(deep=True)
+        
         try:
-            response = await self.llm.ainvoke(messages)
-            return self._parse_synthesis_response(response.content)
+            async with self._llm_semaphore:
+                result = await ainvoke_with_retry(self.structured_llm, messages)
+            llm_response_cache[cache_key] = result.model_copy(deep=True)
+            return result
         except Exception as e:
             logging.error(f"Error in synthesis: {e}")
             return self._create_fallback_analysis(analyses)
     
-    def _parse_synthesis_response(self, response: str) -> AnalysisResult:
-        """Parse the AI response into structured format"""
-        # This is a simplified parser - in production, you'd want more robust parsing
-        lines = response.split('\n')
-        
-        goals = []
-        constraints = []
-        edge_cases = []
-        follow_up_questions = []
-        recommendations = []
-        
-        current_section = None
-        
-        for line in lines:
-            line = line.strip()
-            if 'GOALS' in line.upper():
-                current_section = 'goals'
-            elif 'CONSTRAINTS' in line.upper():
-                current_section = 'constraints'
-            elif 'EDGE' in line.upper() and 'CASES' in line.upper():
-                current_section = 'edge_cases'
-            elif 'FOLLOW' in line.upper() and 'QUESTIONS' in line.upper():
-                current_section = 'follow_up_questions'
-            elif 'RECOMMENDATIONS' in line.upper():
-                current_section = 'recommendations'
-            elif line.startswith('-') or line.startswith('•') or line.startswith('*'):
-                item = line[1:].strip()
-                if current_section == 'goals':
-                    goals.append(item)
-                elif current_section == 'constraints':
-                    constraints.append(item)
-                elif current_section == 'edge_cases':
-                    edge_cases.append(item)
-                elif current_section == 'follow_up_questions':
-                    follow_up_questions.append(item)
-                elif current_section == 'recommendations':
-                    recommendations.append(item)
-        
-        impact_analysis = {
-            'growth_potential': 'High - based on analysis',
-            'revenue_impact': 'Positive - new monetization opportunities',
-            'user_experience': 'Enhanced - improved functionality',
-            'technical_debt': 'Manageable - with proper planning'
-        }
-        
-        return AnalysisResult(
-            goals=goals or ['Define clear product objectives'],
-            constraints=constraints or ['Resource limitations'],
-            edge_cases=edge_cases or ['Unexpected user behavior'],
-            follow_up_questions=follow_up_questions or ['What are the success metrics?'],
-            impact_analysis=impact_analysis,
-            recommendations=recommendations or ['Conduct further research']
-        )
-    
     def _create_fallback_analysis(self, analyses: List[Dict]) -> AnalysisResult:
-        """Create fallback analysis if parsing fails"""
+        """Create fallback analysis if synthesis fails"""
         return AnalysisResult(
             goals=['Analyze product requirements', 'Define success metrics'],
             constraints=['Limited data availability', 'Resource constraints'],
@@ -306,8 +308,9 @@ Provide a structured synthesis covering goals, constraints, edge cases, follow-u
         # Step 1: Gather data from external sources
         external_data = await self.gather_all_data()
         
-        # Step 2: Combine user input with external data
-        combined_data = {**user_requirements, **external_data}
+        # Step 2: Combine user input with external data; the slower-changing external
+        # data goes first so serialized prompts keep a stable leading prefix
+        combined_data = {**external_data, **user_requirements}
         
         # Step 3: Run multi-agent analysis
         analyses = await self.run_multi_agent_analysis(combined_data)
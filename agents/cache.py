@@ -0,0 +1,14 @@
+import hashlib
+from cachetools import TTLCache
+from config import settings
+
+# LLM responses keyed by a hash of the full prompt, shared by all agents
+llm_response_cache = TTLCache(maxsize=256, ttl=settings.llm_cache_ttl_seconds)
+
+def prompt_cache_key(*parts: str) -> str:
+    """Build a cache key from the prompt text sent to the LLM"""
+    digest = hashlib.sha256()
+    for part in parts:
+        digest.update(part.encode("utf-8"))
+        digest.update(b"\0")
+    return digest.hexdigest()
@@ -0,0 +1,149 @@
+import functools
+import itertools
+import threading
+import time
+from typing import Iterable, Iterator, Optional, Type, TypeVar
+import requests
+from github import Github
+from langchain.output_parsers import PydanticOutputParser
+from langchain.schema import OutputParserException
+from langchain.schema import HumanMessage
+from langchain.schema.runnable import Runnable, RunnableLambda
+from langchain_google_genai import ChatGoogleGenerativeAI
+from pydantic import BaseModel, ValidationError
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import MaxRetryError
+from urllib3.util.retry import Retry
+from config import GOOGLE_API_KEY, settings
+
+# Longest Retry-After from GitHub that a request waits out before giving up
+MAX_GITHUB_RETRY_AFTER_SECONDS = 60
+GITHUB_PAGE_SIZE = 100
+
+T = TypeVar('T')
+
+class _RequestRateLimiter:
+    """Thread-safe leaky bucket: bursts of up to `rate` requests, then `rate` per `period` seconds"""
+    
+    def __init__(self, rate: int, period: float = 60):
+        self._capacity = rate
+        self._drain_per_second = rate / period
+        self._level = 0.0
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+    
+    def acquire(self):
+        """Take one slot, sleeping until the bucket has room"""
+        with self._lock:
+            now = time.monotonic()
+            self._level = max(0.0, self._level - (now - self._updated) * self._drain_per_second)
+            self._updated = now
+            delay = (self._level + 1 - self._capacity) / self._drain_per_second
+            self._level += 1
+        if delay > 0:
+            time.sleep(delay)
+
+_github_rate_limiter = _RequestRateLimiter(settings.github_requests_per_minute)
+
+def throttle_github_request():
+    """Take a slot from the settings.github_requests_per_minute budget; call before sending a request"""
+    _github_rate_limiter.acquire()
+
+def paced_github_items(items: Iterable[T], requests_per_item: int = 0) -> Iterator[T]:
+    """Iterate a PyGithub PaginatedList, throttling before each request the iteration sends
+    
+    PyGithub has no pre-send hook, so pacing happens here: one slot before each page of
+    GITHUB_PAGE_SIZE items, plus requests_per_item for lazy attributes read from every item.
+    """
+    iterator = iter(items)
+    for index in itertools.count():
+        if index % GITHUB_PAGE_SIZE == 0:
+            throttle_github_request()
+        try:
+            item = next(iterator)
+        except StopIteration:
+            return
+        for _ in range(requests_per_item):
+            throttle_github_request()
+        yield item
+
+class _ThrottledAdapter(HTTPAdapter):
+    """HTTPAdapter that waits for a rate-limit slot before every request it sends"""
+    
+    def send(self, request, **kwargs):
+        throttle_github_request()
+        return super().send(request, **kwargs)
+
+class GitHubRetry(Retry):
+    """urllib3 retry policy for every GitHub request, from PyGithub or the shared session
+    
+    A 403/429 carrying Retry-After is GitHub's secondary rate limit: it is waited out and
+    retried, unless the wait exceeds MAX_GITHUB_RETRY_AFTER_SECONDS, in which case the
+    rate-limited response is returned to the caller as is.
+    """
+    RETRY_AFTER_STATUS_CODES = frozenset({403, 429})
+    
+    def increment(self, method=None, url=None, response=None, error=None, _pool=None, _stacktrace=None):
+        retry_after = self.get_retry_after(response) if response is not None else None
+        if retry_after is not None and retry_after > MAX_GITHUB_RETRY_AFTER_SECONDS:
+            # urllib3 hands back the response instead of raising, since raise_on_status is off
+            raise MaxRetryError(_pool, url, f"Retry-After of {retry_after:.0f}s exceeds the cap")
+        return super().increment(method, url, response, error, _pool, _stacktrace)
+
+def _github_retry() -> GitHubRetry:
+    """Retry policy for a GitHub connection pool; the GraphQL POSTs are reads, so any method retries"""
+    return GitHubRetry(total=3, allowed_methods=None, raise_on_status=False)
+
+@functools.lru_cache(maxsize=1)
+def get_github_client() -> Optional[Github]:
+    """Shared GitHub client, or None when no token is configured"""
+    if not settings.github_token:
+        return None
+    return Github(
+        settings.github_token,
+        per_page=GITHUB_PAGE_SIZE,
+        retry=_github_retry(),
+        pool_size=settings.github_pool_size
+    )
+
+@functools.lru_cache(maxsize=1)
+def get_http_session() -> requests.Session:
+    """Shared keep-alive session for direct GitHub API calls, pooled, paced and retried like the PyGithub client"""
+    session = requests.Session()
+    session.mount("https://", _ThrottledAdapter(pool_maxsize=settings.github_pool_size, max_retries=_github_retry()))
+    return session
+
+@functools.lru_cache(maxsize=None)
+def get_llm(temperature: float = 0.3) -> ChatGoogleGenerativeAI:
+    """Shared Gemini chat client, one per temperature"""
+    return ChatGoogleGenerativeAI(
+        model="gemini-2.0-flash",
+        google_api_key=GOOGLE_API_KEY,
+        temperature=temperature,
+        convert_system_message_to_human=True
+    )
+
+def with_structured_output(llm, schema: Type[BaseModel]) -> Runnable:
+    """Chain the LLM so it returns an instance of schema instead of free text
+    
+    The pinned langchain-google-genai has no native with_structured_output, so the
+    JSON schema is added to the final prompt message and the reply is parsed. The
+    schema goes first: it is identical on every call, so prompts share a stable
+    prefix that Gemini's implicit prompt caching can reuse.
+    """
+    parser = PydanticOutputParser(pydantic_object=schema)
+    format_instructions = parser.get_format_instructions()
+    
+    def parse(message) -> BaseModel:
+        try:
+            return parser.parse(message.content)
+        except ValidationError as e:
+            # The pinned parser only converts pydantic v1 errors; keep the raw reply for callers
+            raise OutputParserException(f"Failed to parse {schema.__name__}: {e}", llm_output=message.content)
+    
+    def add_format_instructions(prompt):
+        messages = prompt.to_messages() if hasattr(prompt, "to_messages") else list(prompt)
+        last = messages[-1]
+        return messages[:-1] + [HumanMessage(content=f"{format_instructions}\n\n{last.content}")]
+    
+    return RunnableLambda(add_format_instructions) | llm | RunnableLambda(parse)
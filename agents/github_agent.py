@@ -1,30 +1,66 @@
 import asyncio
 import logging
-from datetime import datetime, timedelta
-from typing import Dict, List, Optional
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional, Tuple
+import numpy as np
+import requests
 from github import Github
-from langchain_google_genai import ChatGoogleGenerativeAI
 from langchain.schema import HumanMessage, SystemMessage
 from config import settings
+from .clients import get_github_client, get_http_session, get_llm, paced_github_items, throttle_github_request
+from .cache import llm_response_cache, prompt_cache_key
+from ._github_cache import get_snapshot
+from .rate_limit import ainvoke_with_retry
+
+GITHUB_GRAPHQL_URL = "https://api.github.com/graphql"
+
+COMMIT_HISTORY_QUERY = """
+query($owner: String!, $name: String!, $since: GitTimestamp!, $cursor: String) {
+  repository(owner: $owner, name: $name) {
+    defaultBranchRef {
+      target {
+        ... on Commit {
+          history(since: $since, first: 100, after: $cursor) {
+            pageInfo { hasNextPage endCursor }
+            nodes {
+              oid
+              message
+              url
+              author { name date }
+              additions
+              deletions
+              changedFilesIfAvailable
+            }
+          }
+        }
+      }
+    }
+  }
+}
+"""
 
 class GitHubAgent:
     """Agent 1: GitHub MCP Coordinator for real-time commit reports"""
     
-    def __init__(self):
-        self.github = Github(settings.github_token) if settings.github_token else None
-        self.llm = ChatGoogleGenerativeAI(
-            model="gemini-2.0-flash",
-            google_api_key=settings.google_api_key,
-            temperature=0.3,
-            convert_system_message_to_human=True
-        )
+    def __init__(self, github: Optional[Github] = None, http: Optional[requests.Session] = None,
+                 llm_semaphore: Optional[asyncio.Semaphore] = None):
+        self.github = github or get_github_client()
+        self.http = http or get_http_session()
+        self.llm = get_llm(0.3)
+        self._llm_semaphore = llm_semaphore or asyncio.Semaphore(settings.max_concurrent_llm)
+        # (prompt key, report) of the latest AI report, kept past the cache TTL so
+        # unchanged activity between scheduled runs doesn't cost another LLM call
+        self._last_report: Optional[Tuple[str, str]] = None
         self.repo = None
+        # At most one in-flight GitHub call per pooled connection
+        self._github_semaphore = asyncio.Semaphore(settings.github_pool_size)
         self._setup_repo()
         
     def _setup_repo(self):
         """Initialize GitHub repository connection"""
         if self.github and settings.github_repo_owner and settings.github_repo_name:
             try:
+                throttle_github_request()
                 self.repo = self.github.get_repo(f"{settings.github_repo_owner}/{settings.github_repo_name}")
                 logging.info(f"Connected to repository: {self.repo.full_name}")
             except Exception as e:
@@ -35,42 +71,72 @@ class GitHubAgent:
         if not self.repo:
             return []
         
-        since_date = datetime.now() - timedelta(days=days_back)
+        # PyGithub is blocking, so run it off the event loop
+        async with self._github_semaphore:
+            return await asyncio.to_thread(self._fetch_daily_commits, days_back)
+    
+    def _fetch_daily_commits(self, days_back: int) -> List[Dict]:
+        """Blocking commit fetch, run in a worker thread"""
+        # GitTimestamp needs an explicit offset; a naive time is ambiguous
+        since_date = datetime.now(timezone.utc) - timedelta(days=days_back)
         commits = []
+        cursor = None
         
         try:
-            # Get all commits first, then filter by date
-            all_commits = list(self.repo.get_commits())
-            
-            if not all_commits:
-                logging.info("No commits found in repository")
-                return []
-            
-            # Filter commits by date
-            for commit in all_commits:
-                commit_date = commit.commit.author.date
-                if commit_date >= since_date:
+            # One GraphQL query per 100 commits, filtered by date server-side and
+            # carrying the stats that would otherwise need a REST call per commit
+            while True:
+                response = self.http.post(
+                    GITHUB_GRAPHQL_URL,
+                    json={
+                        'query': COMMIT_HISTORY_QUERY,
+                        'variables': {
+                            'owner': settings.github_repo_owner,
+                            'name': settings.github_repo_name,
+                            'since': since_date.isoformat(),
+                            'cursor': cursor
+                        }
+                    },
+                    headers={'Authorization': f"bearer {settings.github_token}"},
+                    timeout=30
+                )
+                response.raise_for_status()
+                payload = response.json()
+                
+                if payload.get('errors'):
+                    logging.error(f"Error fetching commits: {payload['errors']}")
+                    break
+                
+                branch = payload['data']['repository']['defaultBranchRef']
+                if not branch:
+                    logging.info("Repository is empty - no commits available")
+                    return []
+                
+                history = branch['target']['history']
+                for node in history['nodes']:
+                    # GitActor and its fields are nullable in the GraphQL schema
+                    author = node['author'] or {}
                     commit_data = {
-                        'sha': commit.sha[:8],
-                        'message': commit.commit.message,
-                        'author': commit.commit.author.name,
-                        'date': commit.commit.author.date.isoformat(),
-                        'url': commit.html_url,
-                        'files_changed': len(commit.files) if commit.files else 0,
-                        'additions': commit.stats.additions if commit.stats else 0,
-                        'deletions': commit.stats.deletions if commit.stats else 0,
-                        'total_changes': commit.stats.total if commit.stats else 0
+                        'sha': node['oid'][:8],
+                        'message': node['message'],
+                        'author': author.get('name') or 'Unknown',
+                        'date': author.get('date'),
+                        'url': node['url'],
+                        'files_changed': node['changedFilesIfAvailable'] or 0,
+                        'additions': node['additions'],
+                        'deletions': node['deletions'],
+                        'total_changes': node['additions'] + node['deletions']
                     }
                     commits.append(commit_data)
+                
+                if not history['pageInfo']['hasNextPage']:
+                    break
+                cursor = history['pageInfo']['endCursor']
                     
             logging.info(f"Found {len(commits)} commits in the last {days_back} day(s)")
                 
         except Exception as e:
-            if "empty" in str(e).lower():
-                logging.info("Repository is empty - no commits available")
-                return []
-            else:
-                logging.error(f"Error fetching commits: {e}")
+            logging.error(f"Error fetching commits: {e}")
             
         return commits
     
@@ -79,9 +145,15 @@ class GitHubAgent:
         if not self.repo:
             return []
         
+        async with self._github_semaphore:
+            return await asyncio.to_thread(self._fetch_pull_requests, state)
+    
+    def _fetch_pull_requests(self, state: str) -> List[Dict]:
+        """Blocking pull request fetch, run in a worker thread"""
         prs = []
         try:
-            for pr in self.repo.get_pulls(state=state):
+            # additions/deletions/changed_files aren't in the listing, so each PR costs a lazy GET too
+            for pr in paced_github_items(self.repo.get_pulls(state=state), requests_per_item=1):
                 pr_data = {
                     'number': pr.number,
                     'title': pr.title,
@@ -104,30 +176,23 @@ class GitHubAgent:
         if not self.repo:
             return {}
         
-        try:
-            stats = {
-                'name': self.repo.name,
-                'full_name': self.repo.full_name,
-                'description': self.repo.description,
-                'stars': self.repo.stargazers_count,
-                'forks': self.repo.forks_count,
-                'open_issues': self.repo.open_issues_count,
-                'language': self.repo.language,
-                'size': self.repo.size,
-                'created_at': self.repo.created_at.isoformat(),
-                'updated_at': self.repo.updated_at.isoformat(),
-                'default_branch': self.repo.default_branch
-            }
-            return stats
-        except Exception as e:
-            logging.error(f"Error fetching repository stats: {e}")
-            return {}
+        # Shared with AnalysisAgent so both agents hit GitHub once per window
+        snapshot = await get_snapshot(f"{settings.github_repo_owner}/{settings.github_repo_name}")
+        return snapshot.stats if snapshot else {}
     
-    async def generate_daily_report(self, days_back: int = 1) -> str:
-        """Generate AI-powered daily commit report"""
-        commits = await self.get_daily_commits(days_back)
-        prs = await self.get_pull_requests("open")
-        repo_stats = await self.get_repository_stats()
+    async def generate_daily_report(self, days_back: int = 1, commits: Optional[List[Dict]] = None,
+                                    prs: Optional[List[Dict]] = None, repo_stats: Optional[Dict] = None) -> str:
+        """Generate AI-powered daily commit report
+        
+        Callers that already hold the commits, open PRs and repository stats pass all three
+        so they aren't fetched a second time.
+        """
+        if commits is None or prs is None or repo_stats is None:
+            commits, prs, repo_stats = await asyncio.gather(
+                self.get_daily_commits(days_back),
+                self.get_pull_requests("open"),
+                self.get_repository_stats()
+            )
         
         if not commits and not prs:
             return "No activity found for the specified period."
@@ -167,8 +232,18 @@ Repository Stats:
             HumanMessage(content=human_prompt)
         ]
         
+        cache_key = prompt_cache_key(system_prompt, human_prompt)
+        cached = llm_response_cache.get(cache_key)
+        if cached is None and self._last_report and self._last_report[0] == cache_key:
+            cached = self._last_report[1]
+        if cached is not None:
+            return cached
+        
         try:
-            response = await self.llm.ainvoke(messages)
+            async with self._llm_semaphore:
+                response = await ainvoke_with_retry(self.llm, messages)
+            llm_response_cache[cache_key] = response.content
+            self._last_report = (cache_key, response.content)
             return response.content
         except Exception as e:
             logging.error(f"Error generating AI report: {e}")
@@ -205,8 +280,13 @@ Repository Stats:
         report += f"## Commit Summary\n"
         report += f"- Total commits: {len(commits)}\n"
         if commits:
-            total_additions = sum(c['additions'] for c in commits)
-            total_deletions = sum(c['deletions'] for c in commits)
+            # One pass over the commit dicts, then a C-level column sum
+            changes = np.fromiter(
+                (value for c in commits for value in (c['additions'], c['deletions'])),
+                dtype=np.int64,
+                count=2 * len(commits)
+            ).reshape(-1, 2)
+            total_additions, total_deletions = (int(total) for total in changes.sum(axis=0))
             report += f"- Lines added: {total_additions}\n"
             report += f"- Lines deleted: {total_deletions}\n"
         
@@ -217,15 +297,21 @@ Repository Stats:
 
     async def schedule_daily_reports(self):
         """Schedule daily report generation"""
+        last_report = None
         while True:
             try:
                 report = await self.generate_daily_report()
-                logging.info("Daily report generated successfully")
-                print(f"\n{'='*50}")
-                print("DAILY GITHUB REPORT")
-                print(f"{'='*50}")
-                print(report)
-                print(f"{'='*50}\n")
+                if report == last_report:
+                    # Nothing new to show; don't reprint the same report
+                    logging.info("No new GitHub activity since the last report")
+                else:
+                    last_report = report
+                    logging.info("Daily report generated successfully")
+                    print(f"\n{'='*50}")
+                    print("DAILY GITHUB REPORT")
+                    print(f"{'='*50}")
+                    print(report)
+                    print(f"{'='*50}\n")
             except Exception as e:
                 logging.error(f"Error in scheduled report: {e}")
             
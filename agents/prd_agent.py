@@ -1,13 +1,18 @@
 import asyncio
+import io
 import logging
-from typing import Dict, List, Optional, Any
+import re
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
 from datetime import datetime
-from langchain_google_genai import ChatGoogleGenerativeAI
-from langchain.schema import HumanMessage
+import orjson
+from langchain.schema import HumanMessage, OutputParserException
 from pydantic import BaseModel
-from jinja2 import Template
+from jinja2 import Environment
 from config import settings
 from .analysis_agent import AnalysisResult
+from .clients import get_llm, with_structured_output
+from .cache import llm_response_cache, prompt_cache_key
+from .rate_limit import ainvoke_with_retry
 
 class PRDDocument(BaseModel):
     title: str
@@ -28,19 +33,42 @@ class GherkinScenario(BaseModel):
     background: Optional[str]
     scenarios: List[Dict[str, Any]]
 
-class PRDAgent:
-    """Agent 3: PRD and Gherkin generator"""
-    
-    def __init__(self):
-        self.llm = ChatGoogleGenerativeAI(
-            model="gemini-2.0-flash",
-            google_api_key=settings.google_api_key,
-            temperature=0.2,  # Lower temperature for more structured output
-            convert_system_message_to_human=True
-        )
-        
-        # PRD Template
-        self.prd_template = Template("""
+# Fallback documents, built once; the analysis-specific fields are filled in per call
+_FALLBACK_PRD = PRDDocument(
+    title="Product Requirements Document",
+    overview="This document outlines the requirements for the proposed product feature.",
+    objectives=[],
+    success_metrics=["User adoption rate", "Performance metrics", "Business impact"],
+    user_stories=["As a user, I want to accomplish my tasks efficiently"],
+    functional_requirements=["Implement core functionality", "Ensure data integrity"],
+    non_functional_requirements=["System performance", "Security compliance", "Scalability"],
+    constraints=[],
+    assumptions=["Standard development practices", "Available resources"],
+    risks=[],
+    timeline="Development timeline to be determined",
+    resources=["Development team", "QA resources", "Infrastructure support"]
+)
+
+_FALLBACK_GHERKIN_SCENARIOS = (
+    GherkinScenario(
+        feature="Core Functionality",
+        background="Given the system is properly configured",
+        scenarios=[
+            {
+                'name': "Successful operation",
+                'steps': [
+                    "Given I am a valid user",
+                    "When I perform the main action",
+                    "Then I should see the expected result"
+                ]
+            }
+        ]
+    ),
+)
+
+# PRD template, compiled once and shared by every PRDAgent
+_JINJA_ENV = Environment(autoescape=False, trim_blocks=True, lstrip_blocks=True)
+_PRD_TEMPLATE = _JINJA_ENV.from_string("""
 # Product Requirements Document
 
 ## Product Title
@@ -99,12 +127,50 @@ class PRDAgent:
 
 ---
 *Generated on {{ generation_date }}*
-        """)
-    
-    async def generate_prd(self, analysis_result: AnalysisResult, project_context: Dict = None) -> PRDDocument:
-        """Generate a comprehensive PRD based on analysis results"""
-        
-        system_prompt = """You are a Senior Product Manager creating a comprehensive Product Requirements Document (PRD).
+""")
+
+# The PRD title ("# Product Title: ...") and section headers ("## 3. Success Metrics",
+# "**Risks and Mitigation**", ...) in one pass; the name of the matching group is
+# 'title' or the section the following lines belong to
+_PRD_HEADER_RE = re.compile(
+    r'^(?:# (?=.*title)(?P<title>.*)'
+    r'|(?:#{1,3}|\*\*).*?\b(?:'
+    r'(?P<overview>overview)'
+    r'|(?P<objectives>objectives?)'
+    r'|(?P<success_metrics>success\s*metrics?)'
+    r'|(?P<user_stories>user\s*stor(?:y|ies))'
+    r'|(?P<non_functional_requirements>non[-\s]?functional\s*requirements?)'
+    r'|(?P<functional_requirements>functional\s*requirements?)'
+    r'|(?P<constraints>constraints?)'
+    r'|(?P<assumptions>assumptions?)'
+    r'|(?P<risks>risks?)'
+    r'|(?P<timeline>timeline)'
+    r'|(?P<resources>resources?)'
+    r')\b)',
+    re.IGNORECASE
+)
+_BULLET_RE = re.compile(r'^[-*•]\s+(.*)$')
+
+_GHERKIN_HEADERS = tuple(
+    (prefix, len(prefix), kind)
+    for prefix, kind in (('Feature:', 'feature'), ('Background:', 'background'), ('Scenario:', 'scenario'))
+)
+_GHERKIN_HEADER_PREFIXES = tuple(prefix for prefix, _, _ in _GHERKIN_HEADERS)
+_GHERKIN_STEP_PREFIXES = ('Given ', 'When ', 'Then ', 'And ', 'But ')
+
+def _tokenize_gherkin(text: str) -> Iterator[Tuple[str, str]]:
+    """Yield (kind, value) for each Gherkin line: feature, background, scenario or step"""
+    for line in text.split('\n'):
+        line = line.strip()
+        if line.startswith(_GHERKIN_HEADER_PREFIXES):
+            for prefix, prefix_len, kind in _GHERKIN_HEADERS:
+                if line.startswith(prefix):
+                    yield kind, line[prefix_len:].strip()
+                    break
+        elif line.startswith(_GHERKIN_STEP_PREFIXES):
+            yield 'step', line
+
+PRD_SYSTEM_PROMPT = """You are a Senior Product Manager creating a comprehensive Product Requirements Document (PRD).
 
 Based on the provided analysis, generate a detailed PRD that includes:
 1. Clear product title and overview
@@ -119,257 +185,337 @@ Based on the provided analysis, generate a detailed PRD that includes:
 
 Make the PRD actionable, specific, and aligned with business goals."""
 
-        context_info = f"Project Context: {project_context}" if project_context else "No additional context provided."
+_GHERKIN_SYSTEM_TEMPLATE = """You are a QA Engineer creating Gherkin test scenarios for BDD (Behavior-Driven Development).
+
+Based on the provided {source}, create comprehensive Gherkin scenarios that cover:
+1. Happy path scenarios
+2. Edge cases and error handling
+3. User acceptance criteria
+4. Integration scenarios
+
+Use proper Gherkin syntax:
+- Feature: High-level description
+- Background: Common setup (if needed)
+- Scenario: Specific test case
+- Given: Initial context
+- When: Action performed
+- Then: Expected outcome
+- And/But: Additional steps
+
+Create multiple features covering different aspects of the product."""
+
+GHERKIN_FROM_PRD_SYSTEM_PROMPT = _GHERKIN_SYSTEM_TEMPLATE.format(source="PRD")
+GHERKIN_FROM_ANALYSIS_SYSTEM_PROMPT = _GHERKIN_SYSTEM_TEMPLATE.format(source="product analysis")
+
+def _bullets(items: List[str]) -> str:
+    """Render items as a Markdown bullet list for prompts"""
+    if not items:
+        return ""
+    return "- " + "\n- ".join(items)
+
+# Commits and pull requests quoted in the PRD prompt's project context
+CONTEXT_ITEMS_LIMIT = 5
+
+def _summarize_project_context(project_context: Dict) -> str:
+    """Project context for the PRD prompt as compact, key-sorted JSON
+    
+    Raw GitHub data is reduced to counts and the latest few commits and PRs, so the
+    prompt stays the same size however active the repository is.
+    """
+    summary = dict(project_context)
+    github_data = summary.pop('github_data', None)
+    if github_data:
+        commits = github_data.get('commits') or []
+        prs = github_data.get('pull_requests') or []
+        summary['github_activity'] = {
+            'repository': (github_data.get('repository_stats') or {}).get('full_name'),
+            'commits_count': len(commits),
+            'recent_commits': [commit['message'].split('\n', 1)[0][:100] for commit in commits[:CONTEXT_ITEMS_LIMIT]],
+            'open_pull_requests_count': len(prs),
+            'open_pull_requests': [pr['title'] for pr in prs[:CONTEXT_ITEMS_LIMIT]]
+        }
+    return orjson.dumps(summary, default=str, option=orjson.OPT_SORT_KEYS).decode()
+
+class _LenientPRDParser:
+    """Fallback parser for a PRD reply that came back as free-form Markdown instead of the schema"""
+    
+    def __init__(self, analysis_result: AnalysisResult):
+        self.analysis_result = analysis_result
+        self.title = "Product Requirements Document"
+        self.overview_parts: List[str] = []
+        self.timeline = "To be determined based on resource allocation"
+        self.bullet_sections: Dict[str, List[str]] = {
+            'objectives': [],
+            'success_metrics': [],
+            'user_stories': [],
+            'functional_requirements': [],
+            'non_functional_requirements': [],
+            'assumptions': [],
+            'risks': [],
+            'resources': [],
+        }
+        # Bound appends, resolved once rather than per bullet
+        self._section_appends: Dict[str, Callable[[str], None]] = {name: items.append for name, items in self.bullet_sections.items()}
+        self._add_overview = self.overview_parts.append
+        self.current_section: Optional[str] = None
+        self._append: Optional[Callable[[str], None]] = None
+    
+    def parse(self, text: str) -> PRDDocument:
+        """Parse the reply line by line, filling sections it lacks from the analysis"""
+        parse_line = self._parse_line
+        for line in text.split('\n'):
+            parse_line(line)
+        return self._build()
+    
+    def _parse_line(self, line: str) -> None:
+        line = line.strip()
+        if not line:
+            return
+        
+        # Extract title and identify sections
+        header = _PRD_HEADER_RE.match(line)
+        if header:
+            if header.lastgroup == 'title':
+                self.title = header.group('title').strip()
+                return
+            self.current_section = header.lastgroup
+            self._append = self._section_appends.get(self.current_section)
+            return
+        
+        # Parse content based on current section
+        bullet = _BULLET_RE.match(line)
+        if bullet:
+            if self._append is not None:
+                self._append(bullet.group(1))
+        elif line.startswith('#'):
+            return
+        elif self.current_section == 'overview':
+            self._add_overview(line)
+        elif self.current_section == 'timeline':
+            self.timeline = line
+    
+    def _build(self) -> PRDDocument:
+        analysis_result = self.analysis_result
+        sections = self.bullet_sections
+        return PRDDocument.model_construct(
+            title=self.title,
+            overview=" ".join(self.overview_parts) or "Product overview to be defined",
+            objectives=sections['objectives'] or analysis_result.goals,
+            success_metrics=sections['success_metrics'] or ["User engagement metrics", "Performance benchmarks"],
+            user_stories=sections['user_stories'] or ["As a user, I want to achieve my goals efficiently"],
+            functional_requirements=sections['functional_requirements'] or ["Core functionality implementation"],
+            non_functional_requirements=sections['non_functional_requirements'] or ["Performance", "Security", "Scalability"],
+            constraints=analysis_result.constraints,
+            assumptions=sections['assumptions'] or ["Standard development practices"],
+            risks=sections['risks'] or analysis_result.edge_cases,
+            timeline=self.timeline,
+            resources=sections['resources'] or ["Development team", "QA resources", "Infrastructure"]
+        )
+
+class PRDAgent:
+    """Agent 3: PRD and Gherkin generator"""
+    
+    def __init__(self, llm_semaphore: Optional[asyncio.Semaphore] = None):
+        self.llm = get_llm(0.2)  # Lower temperature for more structured output
+        self.structured_llm = with_structured_output(self.llm, PRDDocument)
+        self._llm_semaphore = llm_semaphore or asyncio.Semaphore(settings.max_concurrent_llm)
+    
+    async def generate_prd(self, analysis_result: AnalysisResult, project_context: Dict = None) -> PRDDocument:
+        """Generate a comprehensive PRD based on analysis results"""
         
-        human_prompt = f"""Create a comprehensive PRD based on this analysis:
+        context_info = f"Project Context: {_summarize_project_context(project_context)}" if project_context else "No additional context provided."
+        
+        # Fixed instructions ahead of the analysis, so the prompt prefix stays cacheable
+        human_prompt = f"""Create a comprehensive PRD based on the analysis below. Generate a structured PRD with specific sections for objectives, user stories, requirements, etc.
 
 GOALS:
-{chr(10).join(f'- {goal}' for goal in analysis_result.goals)}
+{_bullets(analysis_result.goals)}
 
 CONSTRAINTS:
-{chr(10).join(f'- {constraint}' for constraint in analysis_result.constraints)}
+{_bullets(analysis_result.constraints)}
 
 EDGE CASES:
-{chr(10).join(f'- {case}' for case in analysis_result.edge_cases)}
+{_bullets(analysis_result.edge_cases)}
 
 FOLLOW-UP QUESTIONS:
-{chr(10).join(f'- {question}' for question in analysis_result.follow_up_questions)}
+{_bullets(analysis_result.follow_up_questions)}
 
 IMPACT ANALYSIS:
-{chr(10).join(f'- {key}: {value}' for key, value in analysis_result.impact_analysis.items())}
+{_bullets([f'{key}: {value}' for key, value in analysis_result.impact_analysis.items()])}
 
 RECOMMENDATIONS:
-{chr(10).join(f'- {rec}' for rec in analysis_result.recommendations)}
-
-{context_info}
+{_bullets(analysis_result.recommendations)}
 
-Generate a structured PRD with specific sections for objectives, user stories, requirements, etc."""
+{context_info}"""
 
         messages = [
-            HumanMessage(content=f"{system_prompt}\n\n{human_prompt}")
+            HumanMessage(content=f"{PRD_SYSTEM_PROMPT}\n\n{human_prompt}")
         ]
+        # ~4 characters per token; the pinned client doesn't report usage or cached tokens
+        logging.debug("PRD prompt is ~%d tokens before the schema", len(messages[0].content) // 4)
+        
+        cache_key = prompt_cache_key(PRD_SYSTEM_PROMPT, human_prompt)
+        cached = llm_response_cache.get(cache_key)
+        if cached is not None:
+            return cached.model_copy(deep=True)
         
         try:
-            response = await self.llm.ainvoke(messages)
-            return self._parse_prd_response(response.content, analysis_result)
+            async with self._llm_semaphore:
+                prd = await ainvoke_with_retry(self.structured_llm, messages)
+        except OutputParserException as e:
+            # The model answered in Markdown instead of the schema; salvage what it wrote
+            logging.warning("PRD response did not match the schema, parsing it as Markdown")
+            prd = self._parse_prd_response(e.llm_output or "", analysis_result)
         except Exception as e:
             logging.error(f"Error generating PRD: {e}")
             return self._create_fallback_prd(analysis_result)
+        
+        llm_response_cache[cache_key] = prd.model_copy(deep=True)
+        return prd
     
     def _parse_prd_response(self, response: str, analysis_result: AnalysisResult) -> PRDDocument:
-        """Parse AI response into structured PRD format"""
-        lines = response.split('\n')
-        
-        title = "Product Requirements Document"
-        overview = ""
-        objectives = []
-        success_metrics = []
-        user_stories = []
-        functional_requirements = []
-        non_functional_requirements = []
-        constraints = analysis_result.constraints
-        assumptions = []
-        risks = []
-        timeline = "To be determined based on resource allocation"
-        resources = []
-        
-        current_section = None
-        
-        for line in lines:
-            line = line.strip()
-            
-            # Extract title
-            if line.startswith('# ') and 'title' in line.lower():
-                title = line[2:].strip()
-                continue
-            
-            # Identify sections
-            if 'overview' in line.lower() and ('##' in line or '#' in line):
-                current_section = 'overview'
-                continue
-            elif 'objective' in line.lower() and ('##' in line or '#' in line):
-                current_section = 'objectives'
-                continue
-            elif 'success' in line.lower() and 'metric' in line.lower():
-                current_section = 'success_metrics'
-                continue
-            elif 'user' in line.lower() and 'stor' in line.lower():
-                current_section = 'user_stories'
-                continue
-            elif 'functional' in line.lower() and 'requirement' in line.lower() and 'non' not in line.lower():
-                current_section = 'functional_requirements'
-                continue
-            elif 'non-functional' in line.lower() or ('non' in line.lower() and 'functional' in line.lower()):
-                current_section = 'non_functional_requirements'
-                continue
-            elif 'assumption' in line.lower():
-                current_section = 'assumptions'
-                continue
-            elif 'risk' in line.lower():
-                current_section = 'risks'
-                continue
-            elif 'timeline' in line.lower():
-                current_section = 'timeline'
-                continue
-            elif 'resource' in line.lower():
-                current_section = 'resources'
-                continue
-            
-            # Parse content based on current section
-            if current_section == 'overview' and line and not line.startswith('#'):
-                overview += line + " "
-            elif line.startswith('-') or line.startswith('•') or line.startswith('*'):
-                item = line[1:].strip()
-                if current_section == 'objectives':
-                    objectives.append(item)
-                elif current_section == 'success_metrics':
-                    success_metrics.append(item)
-                elif current_section == 'user_stories':
-                    user_stories.append(item)
-                elif current_section == 'functional_requirements':
-                    functional_requirements.append(item)
-                elif current_section == 'non_functional_requirements':
-                    non_functional_requirements.append(item)
-                elif current_section == 'assumptions':
-                    assumptions.append(item)
-                elif current_section == 'risks':
-                    risks.append(item)
-                elif current_section == 'resources':
-                    resources.append(item)
-            elif current_section == 'timeline' and line and not line.startswith('#'):
-                timeline = line
-        
-        return PRDDocument(
-            title=title,
-            overview=overview.strip() or "Product overview to be defined",
-            objectives=objectives or analysis_result.goals,
-            success_metrics=success_metrics or ["User engagement metrics", "Performance benchmarks"],
-            user_stories=user_stories or ["As a user, I want to achieve my goals efficiently"],
-            functional_requirements=functional_requirements or ["Core functionality implementation"],
-            non_functional_requirements=non_functional_requirements or ["Performance", "Security", "Scalability"],
-            constraints=constraints,
-            assumptions=assumptions or ["Standard development practices"],
-            risks=risks or analysis_result.edge_cases,
-            timeline=timeline,
-            resources=resources or ["Development team", "QA resources", "Infrastructure"]
-        )
+        """Parse a free-form Markdown AI response into structured PRD format"""
+        return _LenientPRDParser(analysis_result).parse(response)
     
     def _create_fallback_prd(self, analysis_result: AnalysisResult) -> PRDDocument:
         """Create fallback PRD if parsing fails"""
-        return PRDDocument(
-            title="Product Requirements Document",
-            overview="This document outlines the requirements for the proposed product feature.",
-            objectives=analysis_result.goals,
-            success_metrics=["User adoption rate", "Performance metrics", "Business impact"],
-            user_stories=["As a user, I want to accomplish my tasks efficiently"],
-            functional_requirements=["Implement core functionality", "Ensure data integrity"],
-            non_functional_requirements=["System performance", "Security compliance", "Scalability"],
-            constraints=analysis_result.constraints,
-            assumptions=["Standard development practices", "Available resources"],
-            risks=analysis_result.edge_cases,
-            timeline="Development timeline to be determined",
-            resources=["Development team", "QA resources", "Infrastructure support"]
-        )
+        # Deep copies, so callers can't mutate the shared template or the analysis through the result
+        return _FALLBACK_PRD.model_copy(deep=True, update={
+            'objectives': list(analysis_result.goals),
+            'constraints': list(analysis_result.constraints),
+            'risks': list(analysis_result.edge_cases)
+        })
     
     async def generate_gherkin_scenarios(self, prd: PRDDocument, analysis_result: AnalysisResult = None) -> List[GherkinScenario]:
         """Generate Gherkin test scenarios based on PRD"""
         
-        system_prompt = """You are a QA Engineer creating Gherkin test scenarios for BDD (Behavior-Driven Development).
-
-Based on the provided PRD, create comprehensive Gherkin scenarios that cover:
-1. Happy path scenarios
-2. Edge cases and error handling
-3. User acceptance criteria
-4. Integration scenarios
-
-Use proper Gherkin syntax:
-- Feature: High-level description
-- Background: Common setup (if needed)
-- Scenario: Specific test case
-- Given: Initial context
-- When: Action performed
-- Then: Expected outcome
-- And/But: Additional steps
-
-Create multiple features covering different aspects of the product."""
-
         human_prompt = f"""Create Gherkin test scenarios for this PRD:
 
 TITLE: {prd.title}
 OVERVIEW: {prd.overview}
 
 USER STORIES:
-{chr(10).join(f'- {story}' for story in prd.user_stories)}
+{_bullets(prd.user_stories)}
 
 FUNCTIONAL REQUIREMENTS:
-{chr(10).join(f'- {req}' for req in prd.functional_requirements)}
+{_bullets(prd.functional_requirements)}
 
 NON-FUNCTIONAL REQUIREMENTS:
-{chr(10).join(f'- {req}' for req in prd.non_functional_requirements)}
+{_bullets(prd.non_functional_requirements)}
 
 Generate comprehensive Gherkin scenarios covering main functionality, edge cases, and acceptance criteria."""
 
         messages = [
-            HumanMessage(content=f"{system_prompt}\n\n{human_prompt}")
+            HumanMessage(content=f"{GHERKIN_FROM_PRD_SYSTEM_PROMPT}\n\n{human_prompt}")
         ]
         
+        cache_key = prompt_cache_key(GHERKIN_FROM_PRD_SYSTEM_PROMPT, human_prompt)
+        cached = llm_response_cache.get(cache_key)
+        if cached is not None:
+            return self._parse_gherkin_response(cached)
+        
         try:
-            response = await self.llm.ainvoke(messages)
+            async with self._llm_semaphore:
+                response = await ainvoke_with_retry(self.llm, messages)
+            llm_response_cache[cache_key] = response.content
             return self._parse_gherkin_response(response.content)
         except Exception as e:
             logging.error(f"Error generating Gherkin scenarios: {e}")
             return self._create_fallback_gherkin(prd, analysis_result)
     
+    async def generate_gherkin_scenarios_from_analysis(self, analysis_result: AnalysisResult) -> List[GherkinScenario]:
+        """Generate Gherkin test scenarios directly from analysis results, without waiting for the PRD"""
+        
+        human_prompt = f"""Create Gherkin test scenarios for this product analysis:
+
+GOALS:
+{_bullets(analysis_result.goals)}
+
+CONSTRAINTS:
+{_bullets(analysis_result.constraints)}
+
+EDGE CASES:
+{_bullets(analysis_result.edge_cases)}
+
+RECOMMENDATIONS:
+{_bullets(analysis_result.recommendations)}
+
+Generate comprehensive Gherkin scenarios covering main functionality, edge cases, and acceptance criteria."""
+
+        messages = [
+            HumanMessage(content=f"{GHERKIN_FROM_ANALYSIS_SYSTEM_PROMPT}\n\n{human_prompt}")
+        ]
+        
+        cache_key = prompt_cache_key(GHERKIN_FROM_ANALYSIS_SYSTEM_PROMPT, human_prompt)
+        cached = llm_response_cache.get(cache_key)
+        if cached is not None:
+            return self._parse_gherkin_response(cached)
+        
+        try:
+            async with self._llm_semaphore:
+                response = await ainvoke_with_retry(self.llm, messages)
+            llm_response_cache[cache_key] = response.content
+            return self._parse_gherkin_response(response.content)
+        except Exception as e:
+            logging.error(f"Error generating Gherkin scenarios: {e}")
+            return self._create_fallback_gherkin_scenarios(analysis_result)
+    
     def _parse_gherkin_response(self, response: str) -> List[GherkinScenario]:
         """Parse AI response into Gherkin scenarios"""
-        scenarios = []
-        lines = response.split('\n')
+        scenarios: List[GherkinScenario] = []
+        add_feature = scenarios.append
         
-        current_feature = None
-        current_background = None
-        current_scenario = None
-        current_scenarios = []
+        current_feature: Optional[str] = None
+        current_background: Optional[str] = None
+        current_scenario: Optional[Dict[str, Any]] = None
+        current_scenarios: List[Dict[str, Any]] = []
+        add_scenario = current_scenarios.append
+        steps_append: Optional[Callable[[str], None]] = None
         
-        for line in lines:
-            line = line.strip()
+        for kind, value in _tokenize_gherkin(response):
+            if kind == 'step':
+                if steps_append is not None:
+                    steps_append(value)
+            
+            elif kind == 'scenario':
+                # Save previous scenario if exists
+                if current_scenario:
+                    add_scenario(current_scenario)
+                
+                # Start new scenario
+                current_scenario = {
+                    'name': value,
+                    'steps': []
+                }
+                steps_append = current_scenario['steps'].append
             
-            if line.startswith('Feature:'):
-                # Save previous feature if exists
+            elif kind == 'feature':
+                # Close the open scenario and save previous feature if exists
+                if current_scenario:
+                    add_scenario(current_scenario)
+                    current_scenario = None
+                    steps_append = None
                 if current_feature and current_scenarios:
-                    scenarios.append(GherkinScenario(
+                    add_feature(GherkinScenario.model_construct(
                         feature=current_feature,
                         background=current_background,
                         scenarios=current_scenarios
                     ))
                 
                 # Start new feature
-                current_feature = line[8:].strip()
+                current_feature = value
                 current_background = None
                 current_scenarios = []
-                
-            elif line.startswith('Background:'):
-                current_background = line[11:].strip()
-                
-            elif line.startswith('Scenario:'):
-                # Save previous scenario if exists
-                if current_scenario:
-                    current_scenarios.append(current_scenario)
-                
-                # Start new scenario
-                current_scenario = {
-                    'name': line[9:].strip(),
-                    'steps': []
-                }
-                
-            elif line.startswith(('Given ', 'When ', 'Then ', 'And ', 'But ')):
-                if current_scenario:
-                    current_scenario['steps'].append(line)
+                add_scenario = current_scenarios.append
+            
+            else:
+                current_background = value
         
         # Save last scenario and feature
         if current_scenario:
-            current_scenarios.append(current_scenario)
+            add_scenario(current_scenario)
         if current_feature and current_scenarios:
-            scenarios.append(GherkinScenario(
+            add_feature(GherkinScenario.model_construct(
                 feature=current_feature,
                 background=current_background,
                 scenarios=current_scenarios
@@ -384,22 +530,7 @@ Generate comprehensive Gherkin scenarios covering main functionality, edge cases
     def _create_fallback_gherkin_scenarios(self, analysis_result: AnalysisResult = None) -> List[GherkinScenario]:
         """Create Gherkin scenarios based on analysis results"""
         if not analysis_result:
-            return [
-                GherkinScenario(
-                    feature="Core Functionality",
-                    background="Given the system is properly configured",
-                    scenarios=[
-                        {
-                            'name': "Successful operation",
-                            'steps': [
-                                "Given I am a valid user",
-                                "When I perform the main action",
-                                "Then I should see the expected result"
-                            ]
-                        }
-                    ]
-                )
-            ]
+            return [scenario.model_copy(deep=True) for scenario in _FALLBACK_GHERKIN_SCENARIOS]
         
         # Generate scenarios based on actual analysis results
         scenarios = []
@@ -420,7 +551,7 @@ Generate comprehensive Gherkin scenarios covering main functionality, edge cases
                     ]
                 })
             
-            scenarios.append(GherkinScenario(
+            scenarios.append(GherkinScenario.model_construct(
                 feature="Goal Achievement",
                 background="Given the application is running and accessible",
                 scenarios=goal_scenarios
@@ -441,7 +572,7 @@ Generate comprehensive Gherkin scenarios covering main functionality, edge cases
                     ]
                 })
             
-            scenarios.append(GherkinScenario(
+            scenarios.append(GherkinScenario.model_construct(
                 feature="Constraint Handling",
                 background="Given the system has defined operational limits",
                 scenarios=constraint_scenarios
@@ -462,7 +593,7 @@ Generate comprehensive Gherkin scenarios covering main functionality, edge cases
                     ]
                 })
             
-            scenarios.append(GherkinScenario(
+            scenarios.append(GherkinScenario.model_construct(
                 feature="Edge Case Management",
                 background="Given the system encounters unexpected scenarios",
                 scenarios=edge_case_scenarios
@@ -472,7 +603,7 @@ Generate comprehensive Gherkin scenarios covering main functionality, edge cases
     
     def format_prd_document(self, prd: PRDDocument) -> str:
         """Format PRD document using template"""
-        return self.prd_template.render(
+        return _PRD_TEMPLATE.render(
             title=prd.title,
             overview=prd.overview,
             objectives=prd.objectives,
@@ -485,37 +616,55 @@ Generate comprehensive Gherkin scenarios covering main functionality, edge cases
             risks=prd.risks,
             timeline=prd.timeline,
             resources=prd.resources,
-            generation_date=datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+            generation_date=datetime.now().isoformat(sep=' ', timespec='seconds')
         )
     
     def format_gherkin_scenarios(self, scenarios: List[GherkinScenario]) -> str:
         """Format Gherkin scenarios into readable text"""
-        formatted = []
+        buffer = io.StringIO()
+        write = buffer.write
         
         for scenario_group in scenarios:
-            formatted.append(f"Feature: {scenario_group.feature}")
+            write("Feature: ")
+            write(scenario_group.feature)
+            write("\n")
             
             if scenario_group.background:
-                formatted.append(f"  Background: {scenario_group.background}")
+                write("  Background: ")
+                write(scenario_group.background)
+                write("\n")
             
             for scenario in scenario_group.scenarios:
-                formatted.append(f"\n  Scenario: {scenario['name']}")
+                write("\n  Scenario: ")
+                write(scenario['name'])
+                write("\n")
                 for step in scenario['steps']:
-                    formatted.append(f"    {step}")
+                    write("    ")
+                    write(step)
+                    write("\n")
             
-            formatted.append("")  # Empty line between features
+            write("\n")  # Empty line between features
         
-        return "\n".join(formatted)
+        # No newline after the final separator
+        return buffer.getvalue()[:-1]
     
     async def generate_complete_documentation(self, analysis_result: AnalysisResult, project_context: Dict = None) -> Dict[str, str]:
         """Generate both PRD and Gherkin scenarios"""
         logging.info("Generating PRD and Gherkin documentation...")
         
-        # Generate PRD
-        prd = await self.generate_prd(analysis_result, project_context)
+        # Gherkin scenarios only need the analysis, so generate them alongside the PRD
+        prd, gherkin_scenarios = await asyncio.gather(
+            self.generate_prd(analysis_result, project_context),
+            self.generate_gherkin_scenarios_from_analysis(analysis_result),
+            return_exceptions=True
+        )
         
-        # Generate Gherkin scenarios
-        gherkin_scenarios = await self.generate_gherkin_scenarios(prd, analysis_result)
+        if isinstance(prd, Exception):
+            logging.error(f"Error generating PRD: {prd!r}")
+            prd = self._create_fallback_prd(analysis_result)
+        if isinstance(gherkin_scenarios, Exception):
+            logging.error(f"Error generating Gherkin scenarios: {gherkin_scenarios!r}")
+            gherkin_scenarios = self._create_fallback_gherkin_scenarios(analysis_result)
         
         # Format documents
         formatted_prd = self.format_prd_document(prd)
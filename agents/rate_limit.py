@@ -0,0 +1,55 @@
+import asyncio
+from typing import AsyncIterator
+from tenacity import AsyncRetrying, retry, retry_if_exception_type, stop_after_attempt, wait_exponential_jitter
+
+from config import settings
+
+# The pinned ChatGoogleGenerativeAI already retries every Google API error itself
+# (429s and deadlines included, up to 10 attempts) and has no setting to turn that
+# off, so this layer only covers what it doesn't: an attempt that outlives
+# settings.llm_timeout_seconds is cancelled and tried again
+_TIMEOUT_RETRY = dict(
+    retry=retry_if_exception_type((TimeoutError, asyncio.TimeoutError)),
+    wait=wait_exponential_jitter(initial=1, max=30),
+    stop=stop_after_attempt(3),
+    reraise=True
+)
+_retry_on_timeout = retry(**_TIMEOUT_RETRY)
+
+@_retry_on_timeout
+async def ainvoke_with_retry(runnable, inputs):
+    """Invoke an LLM runnable, giving each attempt settings.llm_timeout_seconds"""
+    return await asyncio.wait_for(runnable.ainvoke(inputs), settings.llm_timeout_seconds)
+
+async def _accumulate(runnable, inputs) -> str:
+    chunks = []
+    async for chunk in runnable.astream(inputs):
+        chunks.append(chunk.content)
+    return "".join(chunks)
+
+@_retry_on_timeout
+async def astream_text_with_retry(runnable, inputs) -> str:
+    """Stream an LLM runnable to completion and return the accumulated text"""
+    return await asyncio.wait_for(_accumulate(runnable, inputs), settings.llm_timeout_seconds)
+
+async def astream_with_retry(runnable, inputs) -> AsyncIterator:
+    """Stream an LLM runnable chunk by chunk, retrying like ainvoke_with_retry until the first chunk
+    
+    Each chunk must arrive within settings.llm_timeout_seconds. Chunks already yielded
+    can't be taken back, so a failure after the first one propagates.
+    """
+    async for attempt in AsyncRetrying(**_TIMEOUT_RETRY):
+        with attempt:
+            stream = runnable.astream(inputs).__aiter__()
+            try:
+                first = await asyncio.wait_for(stream.__anext__(), settings.llm_timeout_seconds)
+            except StopAsyncIteration:
+                return
+    
+    yield first
+    while True:
+        try:
+            chunk = await asyncio.wait_for(stream.__anext__(), settings.llm_timeout_seconds)
+        except StopAsyncIteration:
+            return
+        yield chunk
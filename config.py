@@ -1,26 +1,40 @@
-import os
+from typing import Final, Optional
 from dotenv import load_dotenv
-from pydantic_settings import BaseSettings
-from typing import Optional
+from pydantic_settings import BaseSettings, SettingsConfigDict
 
 load_dotenv()
 
 class Settings(BaseSettings):
+    # Values come from the environment (or .env) by upper-cased field name
+    model_config = SettingsConfigDict(frozen=True, env_file=".env", case_sensitive=False)
+    
     # Google API
-    google_api_key: str = os.getenv("GOOGLE_API_KEY", "")
+    google_api_key: str = ""
     
     # GitHub
-    github_token: Optional[str] = os.getenv("GITHUB_TOKEN", None)
-    github_repo_owner: Optional[str] = os.getenv("GITHUB_REPO_OWNER", None)
-    github_repo_name: Optional[str] = os.getenv("GITHUB_REPO_NAME", None)
+    github_token: Optional[str] = None
+    github_repo_owner: Optional[str] = None
+    github_repo_name: Optional[str] = None
     
     # Logging
-    log_level: str = os.getenv("LOG_LEVEL", "INFO")
+    log_level: str = "INFO"
     
     # Scheduling
-    report_schedule_hours: int = int(os.getenv("REPORT_SCHEDULE_HOURS", "24"))
+    report_schedule_hours: int = 24
+    
+    # Concurrency
+    max_concurrent_llm: int = 4
+    github_pool_size: int = 10
+    github_requests_per_minute: int = 80
+    llm_timeout_seconds: float = 120
     
-    class Config:
-        env_file = ".env"
+    # Caching
+    llm_cache_ttl_seconds: int = 3600
+    github_snapshot_ttl_seconds: int = 300
+    
+    # Output formatting
+    minimize_threshold_tokens: int = 512
 
 settings = Settings()
+
+GOOGLE_API_KEY: Final[str] = settings.google_api_key
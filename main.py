@@ -1,128 +1,421 @@
+import argparse
 import asyncio
+import hashlib
 import logging
-from typing import Dict, Optional
+import os
+import sys
+from typing import AsyncIterator, Awaitable, Dict, Optional, Tuple
 from datetime import datetime
-from agents import GitHubAgent, AnalysisAgent, PRDAgent
+import aiofiles
+import orjson
+from cachetools import LRUCache
+from pydantic import BaseModel
+from agents import GitHubAgent, AnalysisAgent, PRDAgent, get_github_client, get_http_session
 from config import settings
-from output_formatter import format_output, create_section_header
+from output_formatter import format_output, format_outputs, format_plain, stream_output, create_section_header
 
-# Configure logging
-logging.basicConfig(
-    level=getattr(logging, settings.log_level.upper()),
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
-)
+# Configure logging once, even if this module is imported more than once
+_LOG_LEVEL: int = logging.getLevelName(settings.log_level.upper())  # name -> level number
+_LOG_FORMATTER = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+
+if not logging.getLogger().handlers:
+    _handler = logging.StreamHandler()
+    _handler.setFormatter(_LOG_FORMATTER)
+    logging.basicConfig(level=_LOG_LEVEL, handlers=[_handler])
+
+logger = logging.getLogger(__name__)
+
+# Identical requirements reuse an earlier analysis, and an identical analysis and
+# project context reuse earlier documentation, without calling the LLM again
+_analysis_cache = LRUCache(maxsize=64)
+_documentation_cache = LRUCache(maxsize=64)
+
+# Console separators
+_EQ50 = "=" * 50
+_EQ60 = "=" * 60
+_DASH50 = "─" * 50
+
+def _orjson_default(obj):
+    """Serialize pydantic models by their fields; anything else orjson can't handle by str()"""
+    if isinstance(obj, BaseModel):
+        return obj.model_dump()
+    return str(obj)
+
+def _dumps(data, option: int = 0) -> bytes:
+    """orjson serialization shared by cache keys, size estimates and saved results"""
+    return orjson.dumps(data, default=_orjson_default, option=option | orjson.OPT_NON_STR_KEYS)
+
+def _content_hash(data) -> str:
+    """Stable hash of the data's canonical JSON, for exact-match cache keys"""
+    return hashlib.blake2b(_dumps(data, orjson.OPT_SORT_KEYS), digest_size=16).hexdigest()
+
+def _estimated_token_count(data: Dict) -> int:
+    """Rough token count of the data as it would be serialized, at ~4 bytes per token"""
+    return len(_dumps(data)) // 4
+
+def _should_minimize(data: Dict) -> bool:
+    """Only outputs above the threshold are worth an LLM summarization round-trip"""
+    return _estimated_token_count(data) > settings.minimize_threshold_tokens
+
+def _github_format_view(report_data: Dict) -> Dict:
+    """Only what the GitHub summary uses: the report text, counts and repository name"""
+    return {
+        'report': report_data['report'],
+        'commits_count': len(report_data['commits']),
+        'pull_requests_count': len(report_data['pull_requests']),
+        'repository_stats': {'full_name': report_data['repository_stats'].get('full_name', 'Unknown')}
+    }
+
+def _error_result(field: str, error: Exception) -> Dict:
+    """Result of a failed step, with the step's payload field left empty"""
+    return {field: None, 'status': 'error', 'error': str(error)}
+
+def _render_bullet_section(title: str, items) -> str:
+    """A Markdown section with one bullet per item"""
+    return "".join([f"## {title}\n"] + [f"- {item}\n" for item in items])
+
+async def _run_together(*coros: Awaitable):
+    """Run coroutines concurrently; the first failure cancels the rest and is re-raised
+    
+    The asyncio.TaskGroup behaviour, for the Python 3.9+ this project supports.
+    """
+    tasks = [asyncio.ensure_future(coro) for coro in coros]
+    try:
+        _, pending = await asyncio.wait(tasks, return_when=asyncio.FIRST_EXCEPTION)
+    except BaseException:
+        for task in tasks:
+            task.cancel()
+        raise
+    
+    for task in pending:
+        task.cancel()
+    if pending:
+        await asyncio.wait(pending)
+    
+    errors = [task.exception() for task in tasks if not task.cancelled() and task.exception() is not None]
+    if errors:
+        raise errors[0]
+
+async def _read_ahead(chunks: AsyncIterator[str], semaphore: asyncio.Semaphore) -> AsyncIterator[str]:
+    """Yield chunks that a background task drains from the source while holding semaphore
+    
+    The semaphore is released as soon as the source is exhausted, however slowly the
+    consumer gets through what it was handed.
+    """
+    queue: asyncio.Queue = asyncio.Queue()
+    exhausted = object()
+    
+    async def drain():
+        try:
+            async with semaphore:
+                async for chunk in chunks:
+                    queue.put_nowait(chunk)
+        finally:
+            queue.put_nowait(exhausted)
+    
+    drainer = asyncio.ensure_future(drain())
+    try:
+        chunk = await queue.get()
+        while chunk is not exhausted:
+            yield chunk
+            chunk = await queue.get()
+        # Surface a failure from the source
+        await drainer
+    finally:
+        drainer.cancel()
+
+def _print_section(title: str, emoji: str, body: str):
+    """Write a titled console section in one stdout write"""
+    sys.stdout.write(f"{create_section_header(title, emoji)}\n{body}\n{_DASH50}\n")
+    sys.stdout.flush()
+
+# Bytes read from stdin but not yet returned as a line by ainput()
+_stdin_buffer = bytearray()
+
+def _stdin_readable(loop: asyncio.AbstractEventLoop, fd: int) -> asyncio.Future:
+    """Future resolved once fd has input; cancelling it stops watching fd"""
+    readable = loop.create_future()
+    
+    def on_readable():
+        if not readable.done():
+            readable.set_result(None)
+    
+    loop.add_reader(fd, on_readable)
+    readable.add_done_callback(lambda _: loop.remove_reader(fd))
+    return readable
+
+async def ainput(prompt: str = "") -> str:
+    """input() that waits on the event loop instead of blocking it
+    
+    stdin is watched with a loop reader rather than read on a thread, so a cancelled
+    prompt (Ctrl+C) leaves nothing blocked on stdin and no typed line is lost. Where the
+    loop can't watch stdin (a regular file, or the Windows proactor loop) this blocks
+    like input().
+    """
+    loop = asyncio.get_running_loop()
+    sys.stdout.write(prompt)
+    sys.stdout.flush()
+    
+    while b"\n" not in _stdin_buffer:
+        try:
+            fd = sys.stdin.fileno()
+            readable = _stdin_readable(loop, fd)
+        except (OSError, ValueError, NotImplementedError):
+            line = sys.stdin.readline()
+            if not line:
+                raise EOFError
+            return line.rstrip("\n")
+        
+        await readable
+        data = os.read(fd, 4096)
+        if not data:
+            if not _stdin_buffer:
+                raise EOFError
+            break
+        _stdin_buffer.extend(data)
+    
+    line, _, rest = bytes(_stdin_buffer).partition(b"\n")
+    _stdin_buffer[:] = rest
+    return line.decode(sys.stdin.encoding or "utf-8", errors="replace").rstrip("\r")
 
 class MultiAgentOrchestrator:
     """Main orchestrator for coordinating all three agents"""
     
-    def __init__(self):
-        self.github_agent = GitHubAgent()
-        self.analysis_agent = AnalysisAgent()
-        self.prd_agent = PRDAgent()
-        
-    async def run_github_report(self, days_back: int = 1) -> str:
+    def __init__(self, ai_format: bool = True):
+        # Plain rendering only when AI minimization is turned off
+        self.ai_format = ai_format
+        # One GitHub client and one keep-alive HTTP session, shared by every agent call
+        self.http = get_http_session()
+        # One cap on in-flight Gemini calls across all agents and output formatting
+        self._llm_semaphore = asyncio.Semaphore(settings.max_concurrent_llm)
+        self.github_agent = GitHubAgent(github=get_github_client(), http=self.http, llm_semaphore=self._llm_semaphore)
+        self.analysis_agent = AnalysisAgent(llm_semaphore=self._llm_semaphore)
+        self.prd_agent = PRDAgent(llm_semaphore=self._llm_semaphore)
+        # Formatted output by (output type, content hash), so identical data is summarized once
+        self._format_cache = LRUCache(maxsize=128)
+    
+    async def __aenter__(self):
+        return self
+    
+    async def __aexit__(self, *exc_info):
+        self.close()
+    
+    def close(self):
+        """Release pooled HTTP connections"""
+        self.http.close()
+    
+    async def run_github_report(self, days_back: int = 1, display: bool = True) -> str:
         """Run GitHub reporting agent"""
-        logging.info("Starting GitHub report generation...")
+        if not display:
+            return (await self.fetch_github_report(days_back))['formatted']
+        
         try:
-            report = await self.github_agent.generate_daily_report(days_back)
-            commits = await self.github_agent.get_daily_commits(days_back)
-            prs = await self.github_agent.get_pull_requests("open")
-            repo_stats = await self.github_agent.get_repository_stats()
-            
-            # Format the output using AI minimization
-            report_data = {
-                'report': report,
-                'commits': commits,
-                'pull_requests': prs,
-                'repository_stats': repo_stats
-            }
-            
-            formatted_output = await format_output('github', report_data)
-            
-            print(create_section_header("GitHub Activity Report", "📊"))
-            print(formatted_output)
-            print("─" * 50)
-            
+            report_data = await self._collect_github_data(days_back)
+        except Exception as e:
+            logger.error("Error in GitHub report: %s", e)
+            formatted_output = f"❌ **Error generating GitHub report:** {e}"
+            self._display_github_report(formatted_output)
             return formatted_output
+        
+        return await self._display_formatted("GitHub Activity Report", "📊", 'github', _github_format_view(report_data))
+    
+    async def fetch_github_report(self, days_back: int = 1) -> Dict:
+        """Fetch GitHub activity once, returning the formatted report and the raw data behind it"""
+        try:
+            report_data = await self._collect_github_data(days_back)
+            formatted_output = await self._format('github', _github_format_view(report_data))
+            
+            return {'formatted': formatted_output, 'raw': report_data}
+        except Exception as e:
+            logger.error("Error in GitHub report: %s", e)
+            return {'formatted': f"❌ **Error generating GitHub report:** {e}", 'raw': None}
+    
+    async def _collect_github_data(self, days_back: int) -> Dict:
+        """Fetch commits, open PRs and repository stats concurrently, then report on them"""
+        logger.info("Starting GitHub report generation...")
+        commits, prs, repo_stats = await asyncio.gather(
+            self.github_agent.get_daily_commits(days_back),
+            self.github_agent.get_pull_requests("open"),
+            self.github_agent.get_repository_stats(),
+            return_exceptions=True
+        )
+        
+        # A failed fetch degrades its own section instead of the whole report
+        if isinstance(commits, Exception):
+            logger.error("Error fetching commits: %s", commits)
+            commits = []
+        if isinstance(prs, Exception):
+            logger.error("Error fetching pull requests: %s", prs)
+            prs = []
+        if isinstance(repo_stats, Exception):
+            logger.error("Error fetching repository stats: %s", repo_stats)
+            repo_stats = {}
+        
+        # The report is written from the data above rather than fetching it again
+        try:
+            report = await self.github_agent.generate_daily_report(days_back, commits, prs, repo_stats)
         except Exception as e:
-            logging.error(f"Error in GitHub report: {e}")
-            return f"❌ **Error generating GitHub report:** {e}"
+            logger.error("Error generating daily report: %s", e)
+            report = f"❌ **Error generating GitHub report:** {e}"
+        
+        return {
+            'report': report,
+            'commits': commits,
+            'pull_requests': prs,
+            'repository_stats': repo_stats
+        }
+    
+    def _format_cache_key(self, output_type: str, data: Dict) -> Tuple[str, str]:
+        """Formatted output is cached by output type and a hash of the data"""
+        return output_type, _content_hash(data)
     
-    async def run_product_analysis(self) -> Dict:
+    async def _display_formatted(self, title: str, emoji: str, output_type: str, data: Dict) -> str:
+        """Print a formatted section, streaming the LLM's summary to the console as it is generated"""
+        if not self.ai_format or not _should_minimize(data):
+            formatted_output = format_plain(output_type, data)
+            _print_section(title, emoji, formatted_output)
+            return formatted_output
+        
+        cache_key = self._format_cache_key(output_type, data)
+        cached = self._format_cache.get(cache_key)
+        if cached is not None:
+            _print_section(title, emoji, cached)
+            return cached
+        
+        sys.stdout.write(f"{create_section_header(title, emoji)}\n")
+        chunks = []
+        # The semaphore covers the LLM stream only, not the console writes
+        async for chunk in _read_ahead(stream_output(output_type, data), self._llm_semaphore):
+            chunks.append(chunk)
+            sys.stdout.write(chunk)
+            sys.stdout.flush()
+        sys.stdout.write(f"\n{_DASH50}\n")
+        sys.stdout.flush()
+        
+        formatted_output = "".join(chunks)
+        self._format_cache[cache_key] = formatted_output
+        return formatted_output
+    
+    async def _format(self, output_type: str, data: Dict) -> str:
+        """AI-minimize larger outputs; small ones are rendered directly"""
+        return (await self._format_many({output_type: data}))[output_type]
+    
+    async def _format_many(self, sections: Dict[str, Dict]) -> Dict[str, str]:
+        """Format several output types, sending every one that needs the LLM in a single request"""
+        formatted = {}
+        pending = {}
+        for output_type, data in sections.items():
+            if not self.ai_format or not _should_minimize(data):
+                formatted[output_type] = format_plain(output_type, data)
+                continue
+            
+            cache_key = self._format_cache_key(output_type, data)
+            cached = self._format_cache.get(cache_key)
+            if cached is not None:
+                formatted[output_type] = cached
+            else:
+                pending[output_type] = (cache_key, data)
+        
+        if pending:
+            # The formatter takes a semaphore slot per LLM call, including any per-section fallbacks
+            if len(pending) == 1:
+                [(output_type, (_, data))] = pending.items()
+                results = {output_type: await format_output(output_type, data, self._llm_semaphore)}
+            else:
+                results = await format_outputs(
+                    {output_type: data for output_type, (_, data) in pending.items()}, self._llm_semaphore
+                )
+            for output_type, (cache_key, _) in pending.items():
+                self._format_cache[cache_key] = results[output_type]
+            formatted.update(results)
+        
+        return formatted
+    
+    def _display_github_report(self, formatted_output: str):
+        """Print a formatted GitHub report section"""
+        _print_section("GitHub Activity Report", "📊", formatted_output)
+    
+    async def _display_analysis(self, analysis_data: Dict):
+        """Format and print a product analysis section"""
+        await self._display_formatted("Product Analysis Results", "🎯", 'analysis', analysis_data)
+    
+    async def run_product_analysis(self, display: bool = True) -> Dict:
         """Run product requirements analysis"""
-        logging.info("Starting product requirements analysis...")
+        logger.info("Starting product requirements analysis...")
         
         # Get user input for product requirements
-        print("\n" + "="*60)
-        print("PRODUCT REQUIREMENTS INPUT")
-        print("="*60)
+        sys.stdout.write(f"\n{_EQ60}\nPRODUCT REQUIREMENTS INPUT\n{_EQ60}\n")
+        sys.stdout.flush()
         
-        product_name = input("Enter product/feature name: ").strip()
+        product_name = (await ainput("Enter product/feature name: ")).strip()
         if not product_name:
             product_name = "New Product Feature"
             
-        product_description = input("Enter product description: ").strip()
+        product_description = (await ainput("Enter product description: ")).strip()
         if not product_description:
             product_description = "Product feature to be analyzed"
             
-        target_users = input("Enter target users (e.g., developers, end-users): ").strip()
+        target_users = (await ainput("Enter target users (e.g., developers, end-users): ")).strip()
         if not target_users:
             target_users = "General users"
             
-        business_goals = input("Enter business goals (comma-separated): ").strip()
+        business_goals = (await ainput("Enter business goals (comma-separated): ")).strip()
         goals_list = [goal.strip() for goal in business_goals.split(",")] if business_goals else ["Improve user experience"]
         
-        technical_stack = input("Enter technical stack/technologies: ").strip()
+        technical_stack = (await ainput("Enter technical stack/technologies: ")).strip()
         tech_list = [tech.strip() for tech in technical_stack.split(",")] if technical_stack else ["Web application"]
         
-        constraints = input("Enter known constraints (comma-separated): ").strip()
+        constraints = (await ainput("Enter known constraints (comma-separated): ")).strip()
         constraints_list = [constraint.strip() for constraint in constraints.split(",")] if constraints else ["Budget limitations"]
         
-        # Create user requirements data
+        # Create user requirements data: fixed fields first, user-entered fields after.
+        # The timestamp stays out of the prompt payload so identical input serializes identically.
         user_requirements = {
             'user_input': {
                 'source': 'user_requirements',
+                'schema_version': '1',
                 'product_name': product_name,
                 'description': product_description,
                 'target_users': target_users,
                 'business_goals': goals_list,
                 'technical_stack': tech_list,
-                'constraints': constraints_list,
-                'timestamp': datetime.now().isoformat()
+                'constraints': constraints_list
             }
         }
+        metadata = {'timestamp': datetime.now().isoformat()}
+        logger.info("Product requirements captured at %s", metadata['timestamp'])
+        
+        cache_key = _content_hash(user_requirements['user_input'])
+        cached = _analysis_cache.get(cache_key)
         
         try:
-            analysis_result = await self.analysis_agent.analyze_product_requirements_with_input(user_requirements)
+            if cached is not None:
+                logger.info("Reusing cached analysis for identical requirements")
+                analysis_result = cached.model_copy(deep=True)
+            else:
+                analysis_result = await self.analysis_agent.analyze_product_requirements_with_input(user_requirements)
+                _analysis_cache[cache_key] = analysis_result.model_copy(deep=True)
             
             # Format the output using AI minimization
             analysis_data = {
                 'analysis_result': analysis_result,
                 'user_input': user_requirements,
+                'metadata': metadata,
                 'status': 'success'
             }
             
-            formatted_output = await format_output('analysis', analysis_data)
-            
-            print(create_section_header("Product Analysis Results", "🎯"))
-            print(formatted_output)
-            print("─" * 50)
+            if display:
+                await self._display_analysis(analysis_data)
             
             return analysis_data
         except Exception as e:
-            logging.error(f"Error in product analysis: {e}")
-            return {
-                'analysis_result': None,
-                'status': 'error',
-                'error': str(e)
-            }
+            logger.error("Error in product analysis: %s", e)
+            return _error_result('analysis_result', e)
     
-    async def run_prd_generation(self, analysis_result, project_context: Dict = None) -> Dict:
+    async def run_prd_generation(self, analysis_result, project_context: Dict = None, display: bool = True) -> Dict:
         """Run PRD and Gherkin generation"""
-        logging.info("Starting PRD and Gherkin generation...")
+        logger.info("Starting PRD and Gherkin generation...")
         try:
-            prd_agent = PRDAgent()
-            
             # Handle None project_context
             context_data = {}
             if project_context:
@@ -131,10 +424,17 @@ class MultiAgentOrchestrator:
                     'github_data': project_context.get('github_data', None)
                 }
             
-            documentation = await prd_agent.generate_complete_documentation(
-                analysis_result, 
-                project_context=context_data
-            )
+            cache_key = _content_hash({'analysis': analysis_result, 'project_context': context_data})
+            cached = _documentation_cache.get(cache_key)
+            if cached is not None:
+                logger.info("Reusing cached documentation for an identical analysis and context")
+                documentation = dict(cached)
+            else:
+                documentation = await self.prd_agent.generate_complete_documentation(
+                    analysis_result, 
+                    project_context=context_data
+                )
+                _documentation_cache[cache_key] = dict(documentation)
             
             # Format the output using AI minimization
             prd_data = {
@@ -142,24 +442,23 @@ class MultiAgentOrchestrator:
                 'status': 'success'
             }
             
-            formatted_output = await format_output('prd', prd_data)
-            
-            print(create_section_header("PRD Generation Completed", "📋"))
-            print(formatted_output)
-            print("─" * 50)
+            if display:
+                formatted_output = await self._format('prd', prd_data)
+                _print_section("PRD Generation Completed", "📋", formatted_output)
             
             return prd_data
         except Exception as e:
-            logging.error(f"Error in PRD generation: {e}")
-            return {
-                'documentation': None,
-                'status': 'error',
-                'error': str(e)
-            }
+            logger.error("Error in PRD generation: %s", e)
+            return _error_result('documentation', e)
     
-    async def run_complete_workflow(self, project_context: Dict = None, github_days: int = 1) -> Dict:
-        """Run the complete multi-agent workflow"""
-        logging.info("Starting complete multi-agent workflow...")
+    async def run_complete_workflow(self, project_context: Dict = None, github_days: int = 1,
+                                    github_task: Optional["asyncio.Task[Dict]"] = None) -> Dict:
+        """Run the complete multi-agent workflow
+        
+        github_task is an already-started fetch_github_report task, for callers that can
+        begin the fetch before the workflow itself starts.
+        """
+        logger.info("Starting complete multi-agent workflow...")
         
         results = {
             'timestamp': datetime.now().isoformat(),
@@ -169,46 +468,84 @@ class MultiAgentOrchestrator:
             'status': 'in_progress'
         }
         
-        try:
-            # Step 1: Generate GitHub report
-            print("🔄 Step 1: Generating GitHub Activity Report...")
-            github_report = await self.run_github_report(github_days)
-            results['github_report'] = github_report
+        # The stages run as a pipeline: the GitHub report is fetched while the user fills
+        # in the requirements form, and the PRD stage consumes both once they are ready.
+        # maxsize=1 queues hand each result over exactly once.
+        github_queue: asyncio.Queue = asyncio.Queue(maxsize=1)
+        analysis_queue: asyncio.Queue = asyncio.Queue(maxsize=1)
+        
+        async def github_stage():
+            github_result = None
+            try:
+                # Displayed by the PRD stage, so it doesn't interleave with the form prompts
+                github_result = await (github_task or self.fetch_github_report(github_days))
+                results['github_report'] = github_result['formatted']
+            finally:
+                await github_queue.put(github_result)
+        
+        async def analysis_stage():
+            try:
+                # Displayed by the PRD stage, alongside PRD generation
+                results['analysis'] = await self.run_product_analysis(display=False)
+            finally:
+                await analysis_queue.put(results['analysis'])
+        
+        async def prd_stage():
+            analysis_result = await analysis_queue.get()
+            github_result = await github_queue.get()
             
-            # Step 2: Run product analysis
-            print("🔄 Step 2: Running Product Requirements Analysis...")
-            analysis_result = await self.run_product_analysis()
-            results['analysis'] = analysis_result
+            if github_result:
+                self._display_github_report(github_result['formatted'])
             
-            if analysis_result['status'] == 'success':
-                # Step 3: Generate PRD and Gherkin scenarios
-                print("🔄 Step 3: Generating PRD and Gherkin Documentation...")
-                documentation_result = await self.run_prd_generation(
-                    analysis_result['analysis_result'], project_context
-                )
-                results['documentation'] = documentation_result
-                
-                if documentation_result['status'] == 'success':
-                    results['status'] = 'completed'
-                    print("✅ Complete workflow finished successfully!")
-                else:
-                    results['status'] = 'partial_success'
-                    print("⚠️ Workflow completed with some errors in documentation generation")
-            else:
+            if not analysis_result or analysis_result['status'] != 'success':
                 results['status'] = 'failed'
                 print("❌ Workflow failed during analysis phase")
+                return
+            
+            # Step 3: Generate PRD and Gherkin scenarios
+            print("🔄 Step 3: Generating PRD and Gherkin Documentation...")
+            # The PRD works from the data already fetched, not the display summary of it
+            context = {
+                **(project_context or {}),
+                'user_requirements': analysis_result.get('user_input', {}),
+                'github_data': github_result['raw'] if github_result else None
+            }
+            # The analysis summary's LLM round-trip overlaps PRD generation instead of preceding it
+            documentation_result, _ = await asyncio.gather(
+                # Displayed with the workflow summary, so both are formatted in one request
+                self.run_prd_generation(analysis_result['analysis_result'], context, display=False),
+                self._display_analysis(analysis_result)
+            )
+            results['documentation'] = documentation_result
             
+            if documentation_result['status'] == 'success':
+                results['status'] = 'completed'
+                print("✅ Complete workflow finished successfully!")
+            else:
+                results['status'] = 'partial_success'
+                print("⚠️ Workflow completed with some errors in documentation generation")
+        
+        try:
+            print("🔄 Step 1: Generating GitHub Activity Report in the background...")
+            print("🔄 Step 2: Running Product Requirements Analysis...")
+            # A failing stage cancels the others rather than leaving them running unattended
+            await _run_together(github_stage(), analysis_stage(), prd_stage())
         except Exception as e:
-            logging.error(f"Error in complete workflow: {e}")
+            logger.error("Error in complete workflow: %s", e)
             results['status'] = 'failed'
             results['error'] = str(e)
             print(f"❌ Workflow failed: {e}")
         
-        # Format the complete workflow output
-        formatted_output = await format_output('workflow', results)
-        print(create_section_header("Workflow Summary", "🚀"))
-        print(formatted_output)
-        print("─" * 50)
+        # Format the PRD summary and the complete workflow output together
+        sections = {'workflow': results}
+        documentation_result = results['documentation']
+        if documentation_result and documentation_result['status'] == 'success':
+            sections = {'prd': documentation_result, 'workflow': results}
+        formatted = await self._format_many(sections)
+        
+        if 'prd' in formatted:
+            _print_section("PRD Generation Completed", "📋", formatted['prd'])
+        _print_section("Workflow Summary", "🚀", formatted['workflow'])
         
         return results
     
@@ -217,112 +554,124 @@ class MultiAgentOrchestrator:
         print("🚀 Starting GitHub monitoring service...")
         await self.github_agent.schedule_daily_reports()
     
-    def save_results_to_files(self, results: Dict, output_dir: str = "output"):
+    async def _write_file(self, path: str, content: str):
+        """Write a whole file without blocking the event loop"""
+        async with aiofiles.open(path, "w", encoding="utf-8") as f:
+            await f.write(content)
+    
+    async def save_results_to_files(self, results: Dict, output_dir: str = "output"):
         """Save results to files"""
-        import os
-        
-        if not os.path.exists(output_dir):
-            os.makedirs(output_dir)
+        await asyncio.to_thread(os.makedirs, output_dir, exist_ok=True)
         
         timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        files = {}
+        json_results = results
         
         # Save GitHub report
         if results.get('github_report'):
-            with open(f"{output_dir}/github_report_{timestamp}.md", "w", encoding="utf-8") as f:
-                f.write(results['github_report'])
+            files[f"{output_dir}/github_report_{timestamp}.md"] = results['github_report']
         
         # Save analysis results
         if results.get('analysis') and results['analysis']['status'] == 'success':
             analysis = results['analysis']['analysis_result']
-            with open(f"{output_dir}/analysis_{timestamp}.md", "w", encoding="utf-8") as f:
-                f.write(f"# Product Analysis Results\n\n")
-                f.write(f"## Goals\n")
-                for goal in analysis.goals:
-                    f.write(f"- {goal}\n")
-                f.write(f"\n## Constraints\n")
-                for constraint in analysis.constraints:
-                    f.write(f"- {constraint}\n")
-                f.write(f"\n## Edge Cases\n")
-                for case in analysis.edge_cases:
-                    f.write(f"- {case}\n")
-                f.write(f"\n## Follow-up Questions\n")
-                for question in analysis.follow_up_questions:
-                    f.write(f"- {question}\n")
-                f.write(f"\n## Impact Analysis\n")
-                for key, value in analysis.impact_analysis.items():
-                    f.write(f"- **{key}**: {value}\n")
-                f.write(f"\n## Recommendations\n")
-                for rec in analysis.recommendations:
-                    f.write(f"- {rec}\n")
+            sections = [
+                _render_bullet_section("Goals", analysis.goals),
+                _render_bullet_section("Constraints", analysis.constraints),
+                _render_bullet_section("Edge Cases", analysis.edge_cases),
+                _render_bullet_section("Follow-up Questions", analysis.follow_up_questions),
+                _render_bullet_section("Impact Analysis", [f"**{key}**: {value}" for key, value in analysis.impact_analysis.items()]),
+                _render_bullet_section("Recommendations", analysis.recommendations),
+            ]
+            files[f"{output_dir}/analysis_{timestamp}.md"] = "# Product Analysis Results\n\n" + "\n".join(sections)
         
         # Save PRD and Gherkin
         if results.get('documentation') and results['documentation']['status'] == 'success':
             docs = results['documentation']['documentation']
-            
-            with open(f"{output_dir}/prd_{timestamp}.md", "w", encoding="utf-8") as f:
-                f.write(docs['prd'])
-            
-            with open(f"{output_dir}/gherkin_{timestamp}.feature", "w", encoding="utf-8") as f:
-                f.write(docs['gherkin'])
+            files[f"{output_dir}/prd_{timestamp}.md"] = docs['prd']
+            files[f"{output_dir}/gherkin_{timestamp}.feature"] = docs['gherkin']
+            # The JSON keeps the structured PRD and scenarios, not a second copy of the text just written
+            structured_docs = {key: value for key, value in docs.items() if key not in ('prd', 'gherkin')}
+            json_results = {**results, 'documentation': {**results['documentation'], 'documentation': structured_docs}}
+        
+        # Machine-readable copy of the whole run
+        files[f"{output_dir}/results_{timestamp}.json"] = _dumps(json_results, orjson.OPT_INDENT_2).decode()
+        
+        # One write per file, all files concurrently
+        await asyncio.gather(*(self._write_file(path, content) for path, content in files.items()))
         
         print(f"📁 Results saved to {output_dir}/ directory")
 
-async def main():
+async def main(ai_format: bool = True):
     """Main entry point"""
-    orchestrator = MultiAgentOrchestrator()
-    
-    print("🤖 Multi-Agent System Started")
-    print("=" * 50)
-    print("Available Commands:")
-    print("1. GitHub Report Only")
-    print("2. Product Analysis Only") 
-    print("3. Complete Workflow")
-    print("4. Start GitHub Monitoring")
-    print("5. Exit")
-    print("=" * 50)
-    
-    while True:
-        try:
-            choice = input("\nEnter your choice (1-5): ").strip()
+    async with MultiAgentOrchestrator(ai_format=ai_format) as orchestrator:
+    
+        print("🤖 Multi-Agent System Started")
+        print(_EQ50)
+        print("Available Commands:")
+        print("1. GitHub Report Only")
+        print("2. Product Analysis Only") 
+        print("3. Complete Workflow")
+        print("4. Start GitHub Monitoring")
+        print("5. Exit")
+        print(_EQ50)
+    
+        while True:
+            try:
+                choice = (await ainput("\nEnter your choice (1-5): ")).strip()
             
-            if choice == "1":
-                days = int(input("Enter number of days to analyze (default 1): ") or "1")
-                await orchestrator.run_github_report(days)
+                if choice == "1":
+                    days = int(await ainput("Enter number of days to analyze (default 1): ") or "1")
+                    await orchestrator.run_github_report(days)
                 
-            elif choice == "2":
-                result = await orchestrator.run_product_analysis()
-                if result['status'] == 'success':
-                    print("Analysis completed successfully!")
-                else:
-                    print(f"Analysis failed: {result.get('error', 'Unknown error')}")
+                elif choice == "2":
+                    result = await orchestrator.run_product_analysis()
+                    if result['status'] == 'success':
+                        print("Analysis completed successfully!")
+                    else:
+                        print(f"Analysis failed: {result.get('error', 'Unknown error')}")
                     
-            elif choice == "3":
-                days = int(input("Enter number of days for GitHub analysis (default 1): ") or "1")
-                save_files = input("Save results to files? (y/n): ").lower() == 'y'
+                elif choice == "3":
+                    days = int(await ainput("Enter number of days for GitHub analysis (default 1): ") or "1")
+                    # Fetch the report while the remaining prompts wait on the user
+                    github_task = asyncio.create_task(orchestrator.fetch_github_report(days))
+                    try:
+                        save_files = (await ainput("Save results to files? (y/n): ")).lower() == 'y'
+                    except BaseException:
+                        github_task.cancel()
+                        raise
                 
-                results = await orchestrator.run_complete_workflow(github_days=days)
+                    results = await orchestrator.run_complete_workflow(github_days=days, github_task=github_task)
                 
-                if save_files:
-                    orchestrator.save_results_to_files(results)
+                    if save_files:
+                        await orchestrator.save_results_to_files(results)
                 
-                print(f"\nWorkflow Status: {results['status']}")
+                    print(f"\nWorkflow Status: {results['status']}")
                 
-            elif choice == "4":
-                print("Starting continuous GitHub monitoring...")
-                await orchestrator.start_github_monitoring()
+                elif choice == "4":
+                    print("Starting continuous GitHub monitoring...")
+                    await orchestrator.start_github_monitoring()
                 
-            elif choice == "5":
-                print("👋 Goodbye!")
-                break
+                elif choice == "5":
+                    print("👋 Goodbye!")
+                    break
                 
-            else:
-                print("Invalid choice. Please enter 1-5.")
+                else:
+                    print("Invalid choice. Please enter 1-5.")
                 
-        except KeyboardInterrupt:
-            print("\n👋 Goodbye!")
-            break
-        except Exception as e:
-            print(f"Error: {e}")
+            # asyncio.run turns Ctrl+C into a cancellation of this task
+            except (KeyboardInterrupt, asyncio.CancelledError, EOFError):
+                print("\n👋 Goodbye!")
+                break
+            except Exception as e:
+                print(f"Error: {e}")
 
 if __name__ == "__main__":
-    asyncio.run(main())
+    parser = argparse.ArgumentParser(description="Multi-agent GitHub, analysis and PRD system")
+    parser.add_argument("--no-ai-format", action="store_true",
+                        help="render outputs directly instead of summarizing them with the LLM")
+    args = parser.parse_args()
+    try:
+        asyncio.run(main(ai_format=not args.no_ai_format))
+    except KeyboardInterrupt:
+        # Python < 3.11 raises Ctrl+C out of asyncio.run after main() has said goodbye
+        pass
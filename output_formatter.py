@@ -1,28 +1,25 @@
 import asyncio
+import functools
 import logging
-from typing import Dict, List, Any, Optional
-from langchain_google_genai import ChatGoogleGenerativeAI
-from langchain.schema import HumanMessage
-from config import settings
-import json
+from typing import AsyncIterator, Dict, List, Any, Optional, Tuple
+from langchain.schema import HumanMessage, SystemMessage
+import orjson
+from agents.cache import llm_response_cache, prompt_cache_key
+from agents.clients import get_llm
+from agents.rate_limit import ainvoke_with_retry, astream_with_retry
 import re
 from datetime import datetime
 
-class OutputFormatter:
-    """AI-powered output formatter to minimize verbose text and present key information"""
-    
-    def __init__(self):
-        self.llm = ChatGoogleGenerativeAI(
-            model="gemini-2.0-flash",
-            google_api_key=settings.google_api_key,
-            temperature=0.1,  # Low temperature for consistent formatting
-            convert_system_message_to_human=True
-        )
-    
-    async def format_github_report(self, report_data: Dict) -> str:
-        """Format GitHub report with minimal, key information"""
-        system_prompt = """You are an expert at extracting and presenting key information concisely.
-        
+logger = logging.getLogger(__name__)
+
+# A leading bullet marker on a list item
+_BULLET_RE = re.compile(r'^[-•*]\s*')
+
+# The outermost JSON object in a reply, ignoring any Markdown fences around it
+_JSON_OBJECT_RE = re.compile(r"\{.*\}", re.DOTALL)
+
+GITHUB_SYSTEM_PROMPT = """You are an expert at extracting and presenting key information concisely.
+
 Transform the verbose GitHub report into a clean, minimal format with:
 - 📊 **Executive Summary** (2-3 lines max)
 - 🔥 **Key Highlights** (3-5 bullet points)
@@ -31,35 +28,136 @@ Transform the verbose GitHub report into a clean, minimal format with:
 
 Use emojis, bold text, and clear structure. Keep it under 200 words total."""
 
+ANALYSIS_SYSTEM_PROMPT = """Extract and present only the most critical analysis insights.
+
+Format as:
+- 🎯 **Key Goals** (top 3 only)
+- ⚠️ **Critical Constraints** (top 3 only)  
+- 💡 **Top Recommendations** (top 3 only)
+- 📊 **Impact Summary** (one line each for growth, revenue, UX)
+
+Use bullet points, emojis, and keep under 150 words total."""
+
+PRD_SUMMARY_SYSTEM_PROMPT = """Summarize PRD generation results concisely.
+
+Format as:
+- 📋 **PRD Status** (completion status)
+- 🧪 **Test Scenarios** (number generated)
+- 📄 **Document Summary** (2-3 key points from PRD)
+- ✅ **Next Steps** (immediate actions)
+
+Keep under 100 words total."""
+
+WORKFLOW_SYSTEM_PROMPT = """Create an executive summary of the complete workflow.
+
+Format as:
+- 🚀 **Workflow Status** (overall completion)
+- 📊 **Key Metrics** (commits, goals, docs generated)
+- 🎯 **Main Outcomes** (top 3 achievements)
+- 🔄 **Next Actions** (immediate next steps)
+
+Keep under 120 words total. Focus on business value."""
+
+BATCH_SYSTEM_PROMPT = """You format several outputs in one reply. Each section below has its own instructions and data.
+
+Reply with only a JSON object whose keys are the section names and whose values are the formatted text for that section, following that section's instructions."""
+
+def _github_counts(report_data: Dict) -> Tuple[int, int]:
+    """Commit and PR counts, taken from precomputed counts when the caller passed those instead of the lists"""
+    commits = report_data.get('commits_count', len(report_data.get('commits', [])))
+    prs = report_data.get('pull_requests_count', len(report_data.get('pull_requests', [])))
+    return commits, prs
+
+def _parse_batch_reply(response: str, sections: Dict[str, Dict]) -> Dict[str, str]:
+    """Formatted text per requested section from a batch reply, skipping anything malformed"""
+    match = _JSON_OBJECT_RE.search(response)
+    if not match:
+        return {}
+    try:
+        reply = orjson.loads(match.group(0))
+    except orjson.JSONDecodeError:
+        return {}
+    if not isinstance(reply, dict):
+        return {}
+    return {key: value for key, value in reply.items() if key in sections and isinstance(value, str)}
+
+class OutputFormatter:
+    """AI-powered output formatter to minimize verbose text and present key information"""
+    
+    def __init__(self):
+        self.llm = get_llm(0.1)  # Low temperature for consistent formatting
+        
+        # Per output type: prompt builder, LLM formatter and plain fallback
+        self._prompt_builders = {
+            'github': self._github_prompts,
+            'analysis': self._analysis_prompts,
+            'prd': self._prd_prompts,
+            'workflow': self._workflow_prompts
+        }
+        self.formatters = {
+            'github': self.format_github_report,
+            'analysis': self.format_analysis_result,
+            'prd': self.format_prd_result,
+            'workflow': self.format_complete_workflow
+        }
+        self.fallbacks = {
+            'github': self._fallback_github_format,
+            'analysis': self._fallback_analysis_format,
+            'prd': self._fallback_prd_format,
+            'workflow': self._fallback_workflow_format
+        }
+    
+    def _lookup(self, system_prompt: str, human_prompt: str) -> Optional[str]:
+        """Cached answer to an identical earlier prompt
+        
+        Exact matches only: near-identical prompts differ in the counts and timestamps
+        the summary is meant to report.
+        """
+        return llm_response_cache.get(prompt_cache_key(system_prompt, human_prompt))
+    
+    def _store(self, system_prompt: str, human_prompt: str, text: str):
+        """Remember an answer for later identical prompts"""
+        llm_response_cache[prompt_cache_key(system_prompt, human_prompt)] = text
+    
+    async def _complete(self, system_prompt: str, human_prompt: str) -> str:
+        """Run a formatting prompt through the LLM"""
+        messages = [SystemMessage(content=system_prompt), HumanMessage(content=human_prompt)]
+        response = await ainvoke_with_retry(self.llm, messages)
+        return response.content
+    
+    async def _invoke(self, system_prompt: str, human_prompt: str) -> str:
+        """Run a formatting prompt, reusing the answer to an identical earlier prompt"""
+        cached = self._lookup(system_prompt, human_prompt)
+        if cached is not None:
+            return cached
+        
+        text = await self._complete(system_prompt, human_prompt)
+        self._store(system_prompt, human_prompt, text)
+        return text
+    
+    def _github_prompts(self, report_data: Dict) -> Tuple[str, str]:
+        """System and human prompts for minimizing a GitHub report"""
+        commits, prs = _github_counts(report_data)
         human_prompt = f"""Minimize this GitHub report data:
         
 Report: {report_data.get('report', '')}
-Commits: {len(report_data.get('commits', []))} commits
-PRs: {len(report_data.get('pull_requests', []))} pull requests
+Commits: {commits} commits
+PRs: {prs} pull requests
 Repository: {report_data.get('repository_stats', {}).get('full_name', 'Unknown')}
 
 Extract only the most important information and format it cleanly."""
-
+        return GITHUB_SYSTEM_PROMPT, human_prompt
+    
+    async def format_github_report(self, report_data: Dict) -> str:
+        """Format GitHub report with minimal, key information"""
         try:
-            messages = [HumanMessage(content=f"{system_prompt}\n\n{human_prompt}")]
-            response = await self.llm.ainvoke(messages)
-            return response.content
+            return await self._invoke(*self._github_prompts(report_data))
         except Exception as e:
-            logging.error(f"Error formatting GitHub report: {e}")
+            logger.error("Error formatting GitHub report: %s", e)
             return self._fallback_github_format(report_data)
     
-    async def format_analysis_result(self, analysis_data: Dict) -> str:
-        """Format analysis results with key insights only"""
-        system_prompt = """Extract and present only the most critical analysis insights.
-        
-Format as:
-- 🎯 **Key Goals** (top 3 only)
-- ⚠️ **Critical Constraints** (top 3 only)  
-- 💡 **Top Recommendations** (top 3 only)
-- 📊 **Impact Summary** (one line each for growth, revenue, UX)
-
-Use bullet points, emojis, and keep under 150 words total."""
-
+    def _analysis_prompts(self, analysis_data: Dict) -> Tuple[str, str]:
+        """System and human prompts for minimizing analysis results"""
         analysis = analysis_data.get('analysis_result') or analysis_data.get('analysis', {})
         
         # Handle both object attributes and dictionary keys
@@ -82,58 +180,40 @@ Recommendations: {recommendations}
 Impact: {impact}
 
 Show only the most important items."""
-
+        return ANALYSIS_SYSTEM_PROMPT, human_prompt
+    
+    async def format_analysis_result(self, analysis_data: Dict) -> str:
+        """Format analysis results with key insights only"""
         try:
-            messages = [HumanMessage(content=f"{system_prompt}\n\n{human_prompt}")]
-            response = await self.llm.ainvoke(messages)
-            return response.content
+            return await self._invoke(*self._analysis_prompts(analysis_data))
         except Exception as e:
-            logging.error(f"Error formatting analysis: {e}")
+            logger.error("Error formatting analysis: %s", e)
             return self._fallback_analysis_format(analysis_data)
     
-    async def format_prd_result(self, prd_data: Dict) -> str:
-        """Format PRD generation results with summary only"""
-        system_prompt = """Summarize PRD generation results concisely.
-        
-Format as:
-- 📋 **PRD Status** (completion status)
-- 🧪 **Test Scenarios** (number generated)
-- 📄 **Document Summary** (2-3 key points from PRD)
-- ✅ **Next Steps** (immediate actions)
-
-Keep under 100 words total."""
-
+    def _prd_prompts(self, prd_data: Dict) -> Tuple[str, str]:
+        """System and human prompts for summarizing PRD generation"""
         documentation = prd_data.get('documentation', {})
         
         human_prompt = f"""Summarize this PRD generation:
         
 Status: {prd_data.get('status', 'unknown')}
-PRD Length: {len(str(documentation.get('prd', ''))) if documentation else 0} characters
-Gherkin Length: {len(str(documentation.get('gherkin', ''))) if documentation else 0} characters
+PRD Length: {len(documentation.get('prd') or '') if documentation else 0} characters
+Gherkin Length: {len(documentation.get('gherkin') or '') if documentation else 0} characters
 Analysis Summary: {prd_data.get('analysis_summary', {})}
 
 Provide a brief, actionable summary."""
-
+        return PRD_SUMMARY_SYSTEM_PROMPT, human_prompt
+    
+    async def format_prd_result(self, prd_data: Dict) -> str:
+        """Format PRD generation results with summary only"""
         try:
-            messages = [HumanMessage(content=f"{system_prompt}\n\n{human_prompt}")]
-            response = await self.llm.ainvoke(messages)
-            return response.content
+            return await self._invoke(*self._prd_prompts(prd_data))
         except Exception as e:
-            logging.error(f"Error formatting PRD: {e}")
+            logger.error("Error formatting PRD: %s", e)
             return self._fallback_prd_format(prd_data)
     
-    async def format_complete_workflow(self, workflow_data: Dict) -> str:
-        """Format complete workflow results with executive summary"""
-        system_prompt = """Create an executive summary of the complete workflow.
-        
-Format as:
-- 🚀 **Workflow Status** (overall completion)
-- 📊 **Key Metrics** (commits, goals, docs generated)
-- 🎯 **Main Outcomes** (top 3 achievements)
-- 🔄 **Next Actions** (immediate next steps)
-
-Keep under 120 words total. Focus on business value."""
-
+    def _workflow_prompts(self, workflow_data: Dict) -> Tuple[str, str]:
+        """System and human prompts for a workflow executive summary"""
         human_prompt = f"""Summarize this complete workflow:
         
 Status: {workflow_data.get('status', 'unknown')}
@@ -143,19 +223,82 @@ Documentation: {'Generated' if workflow_data.get('documentation') else 'Not gene
 Timestamp: {workflow_data.get('timestamp', '')}
 
 Provide an executive summary focusing on value delivered."""
-
+        return WORKFLOW_SYSTEM_PROMPT, human_prompt
+    
+    async def format_complete_workflow(self, workflow_data: Dict) -> str:
+        """Format complete workflow results with executive summary"""
         try:
-            messages = [HumanMessage(content=f"{system_prompt}\n\n{human_prompt}")]
-            response = await self.llm.ainvoke(messages)
-            return response.content
+            return await self._invoke(*self._workflow_prompts(workflow_data))
         except Exception as e:
-            logging.error(f"Error formatting workflow: {e}")
+            logger.error("Error formatting workflow: %s", e)
             return self._fallback_workflow_format(workflow_data)
     
+    def _prompts(self, output_type: str, data: Dict) -> Tuple[str, str]:
+        """System and human prompts for any output type"""
+        return self._prompt_builders[output_type](data)
+    
+    async def stream(self, output_type: str, data: Dict) -> AsyncIterator[str]:
+        """Yield the formatted output piece by piece as the LLM generates it"""
+        system_prompt, human_prompt = self._prompts(output_type, data)
+        cached = self._lookup(system_prompt, human_prompt)
+        if cached is not None:
+            yield cached
+            return
+        
+        chunks = []
+        try:
+            messages = [SystemMessage(content=system_prompt), HumanMessage(content=human_prompt)]
+            async for chunk in astream_with_retry(self.llm, messages):
+                chunks.append(chunk.content)
+                yield chunk.content
+        except Exception as e:
+            logger.error("Error streaming %s output: %s", output_type, e)
+            # Once text has been shown, a fallback appended to it would only confuse
+            if not chunks:
+                yield format_plain(output_type, data)
+            return
+        
+        self._store(system_prompt, human_prompt, "".join(chunks))
+    
+    async def format_all(self, sections: Dict[str, Dict], llm_semaphore: Optional[asyncio.Semaphore] = None) -> Dict[str, str]:
+        """Format several output types with one LLM call, keyed by output type
+        
+        Sections missing from the reply, or every section if the reply isn't valid
+        JSON, are formatted individually instead. Each LLM call, the batch and every
+        fallback alike, holds its own llm_semaphore slot.
+        """
+        human_prompt = "\n\n".join(
+            f"### Section: {output_type}\nInstructions:\n{system_prompt}\n\nData:\n{section_prompt}"
+            for output_type, (system_prompt, section_prompt) in (
+                (output_type, self._prompts(output_type, data)) for output_type, data in sections.items()
+            )
+        )
+        
+        formatted = {}
+        try:
+            cached = self._lookup(BATCH_SYSTEM_PROMPT, human_prompt)
+            if cached is not None:
+                response = cached
+            else:
+                response = await _limited(self._complete(BATCH_SYSTEM_PROMPT, human_prompt), llm_semaphore)
+            formatted = _parse_batch_reply(response, sections)
+            # Only a complete reply is worth replaying; a bad one gets another chance next time
+            if cached is None and len(formatted) == len(sections):
+                self._store(BATCH_SYSTEM_PROMPT, human_prompt, response)
+        except Exception as e:
+            logger.error("Error batch formatting %s: %s", ", ".join(sections), e)
+        
+        missing = [output_type for output_type in sections if output_type not in formatted]
+        if missing:
+            results = await asyncio.gather(*(
+                format_output(output_type, sections[output_type], llm_semaphore) for output_type in missing
+            ))
+            formatted.update(zip(missing, results))
+        return formatted
+    
     def _fallback_github_format(self, data: Dict) -> str:
         """Fallback GitHub formatting if AI fails"""
-        commits = len(data.get('commits', []))
-        prs = len(data.get('pull_requests', []))
+        commits, prs = _github_counts(data)
         repo = data.get('repository_stats', {}).get('full_name', 'Unknown')
         
         return f"""📊 **GitHub Summary**
@@ -166,7 +309,8 @@ Provide an executive summary focusing on value delivered."""
     def _fallback_analysis_format(self, data: Dict) -> str:
         """Fallback analysis formatting if AI fails"""
         analysis = data.get('analysis_result') or data.get('analysis', {})
-        goals_count = len(getattr(analysis, 'goals', analysis.get('goals', [])))
+        goals = analysis.goals if hasattr(analysis, 'goals') else analysis.get('goals', [])
+        goals_count = len(goals)
         
         return f"""🎯 **Analysis Summary**
 • **Goals Identified:** {goals_count}
@@ -191,21 +335,43 @@ Provide an executive summary focusing on value delivered."""
 • **Completion:** {datetime.now().strftime('%Y-%m-%d %H:%M')}
 • **Action:** Review results and proceed"""
 
+UNKNOWN_OUTPUT_TYPE = "❌ **Unknown output type**"
+
+@functools.lru_cache(maxsize=1)
+def get_formatter() -> OutputFormatter:
+    """Shared formatter, so its client is built once rather than per call"""
+    return OutputFormatter()
+
+async def _limited(awaitable, semaphore: Optional[asyncio.Semaphore]):
+    """Await under the semaphore, if there is one"""
+    if semaphore is None:
+        return await awaitable
+    async with semaphore:
+        return await awaitable
+
 # Utility functions for easy integration
-async def format_output(output_type: str, data: Dict) -> str:
+async def format_output(output_type: str, data: Dict, llm_semaphore: Optional[asyncio.Semaphore] = None) -> str:
     """Main function to format any output type"""
-    formatter = OutputFormatter()
-    
-    if output_type == 'github':
-        return await formatter.format_github_report(data)
-    elif output_type == 'analysis':
-        return await formatter.format_analysis_result(data)
-    elif output_type == 'prd':
-        return await formatter.format_prd_result(data)
-    elif output_type == 'workflow':
-        return await formatter.format_complete_workflow(data)
-    else:
-        return "❌ **Unknown output type**"
+    format_method = get_formatter().formatters.get(output_type)
+    if format_method is None:
+        return UNKNOWN_OUTPUT_TYPE
+    return await _limited(format_method(data), llm_semaphore)
+
+async def format_outputs(sections: Dict[str, Dict], llm_semaphore: Optional[asyncio.Semaphore] = None) -> Dict[str, str]:
+    """Format several output types at once, keyed by output type"""
+    return await get_formatter().format_all(sections, llm_semaphore)
+
+async def stream_output(output_type: str, data: Dict) -> AsyncIterator[str]:
+    """Format any output type, yielding text as soon as the LLM produces it"""
+    async for chunk in get_formatter().stream(output_type, data):
+        yield chunk
+
+def format_plain(output_type: str, data: Dict) -> str:
+    """Format any output type without calling the LLM"""
+    fallback = get_formatter().fallbacks.get(output_type)
+    if fallback is None:
+        return UNKNOWN_OUTPUT_TYPE
+    return fallback(data)
 
 def create_section_header(title: str, emoji: str = "📋") -> str:
     """Create consistent section headers"""
@@ -216,11 +382,8 @@ def format_bullet_list(items: List[str], max_items: int = 5) -> str:
     if not items:
         return "• No items available"
     
-    formatted_items = []
-    for i, item in enumerate(items[:max_items]):
-        # Clean up the item text
-        clean_item = re.sub(r'^[-•*]\s*', '', item.strip())
-        formatted_items.append(f"• {clean_item}")
+    # Clean up the item text
+    formatted_items = [f"• {_BULLET_RE.sub('', item.strip())}" for item in items[:max_items]]
     
     if len(items) > max_items:
         formatted_items.append(f"• ... and {len(items) - max_items} more")
@@ -45,19 +45,21 @@ def test_github_connection():
             default_branch = repo.get_branch(repo.default_branch)
             print(f"✅ Default branch '{repo.default_branch}' exists")
             
-            # Get total commit count
-            commits = list(repo.get_commits())
-            print(f"📊 Total commits: {len(commits)}")
+            # Get total commit count; totalCount reads the last-page link instead of walking every page
+            commits = repo.get_commits()
+            total_commits = commits.totalCount
+            print(f"📊 Total commits: {total_commits}")
             
-            if commits:
-                print(f"   Latest commit: {commits[0].commit.message[:50]}...")
-                print(f"   Author: {commits[0].commit.author.name}")
-                print(f"   Date: {commits[0].commit.author.date}")
+            if total_commits:
+                latest = commits[0]
+                print(f"   Latest commit: {latest.commit.message[:50]}...")
+                print(f"   Author: {latest.commit.author.name}")
+                print(f"   Date: {latest.commit.author.date}")
                 
                 # Test commits in last 7 days
                 since_date = datetime.now() - timedelta(days=7)
-                recent_commits = list(repo.get_commits(since=since_date))
-                print(f"   Commits in last 7 days: {len(recent_commits)}")
+                recent_commits = repo.get_commits(since=since_date)
+                print(f"   Commits in last 7 days: {recent_commits.totalCount}")
             else:
                 print("   No commits found")
                 
@@ -69,15 +71,15 @@ def test_github_connection():
         
         # Test issues
         try:
-            issues = list(repo.get_issues(state='all'))
-            print(f"📋 Total issues: {len(issues)}")
+            issues = repo.get_issues(state='all')
+            print(f"📋 Total issues: {issues.totalCount}")
         except Exception as e:
             print(f"⚠️  Could not fetch issues: {e}")
             
         # Test pull requests
         try:
-            prs = list(repo.get_pulls(state='all'))
-            print(f"🔄 Total pull requests: {len(prs)}")
+            prs = repo.get_pulls(state='all')
+            print(f"🔄 Total pull requests: {prs.totalCount}")
         except Exception as e:
             print(f"⚠️  Could not fetch pull requests: {e}")
             
@@ -0,0 +1,183 @@
+import asyncio
+import os
+import time
+import unittest
+from unittest import mock
+
+os.environ.setdefault("GOOGLE_API_KEY", "test-key")
+
+from urllib3.exceptions import MaxRetryError
+from urllib3.response import HTTPResponse
+from langchain_community.chat_models.fake import FakeListChatModel
+from agents import _github_cache
+from agents.cache import llm_response_cache
+from agents.clients import GitHubRetry, _RequestRateLimiter, _github_retry, paced_github_items
+from agents.github_agent import GitHubAgent
+
+def _node(oid, author, additions=1, deletions=2):
+    return {
+        'oid': oid,
+        'message': f"Commit {oid}",
+        'url': f"https://github.com/acme/app/commit/{oid}",
+        'author': author,
+        'additions': additions,
+        'deletions': deletions,
+        'changedFilesIfAvailable': None
+    }
+
+def _page(nodes, cursor=None):
+    return {'data': {'repository': {'defaultBranchRef': {'target': {'history': {
+        'pageInfo': {'hasNextPage': cursor is not None, 'endCursor': cursor},
+        'nodes': nodes
+    }}}}}}
+
+class FakeResponse:
+    def __init__(self, payload):
+        self.payload = payload
+
+    def raise_for_status(self):
+        pass
+
+    def json(self):
+        return self.payload
+
+class FakeSession:
+    """Replays GraphQL pages and records the cursor each request asked for"""
+
+    def __init__(self, pages):
+        self.pages = list(pages)
+        self.cursors = []
+
+    def post(self, url, json, headers, timeout):
+        self.cursors.append(json['variables']['cursor'])
+        return FakeResponse(self.pages.pop(0))
+
+COMMITS = [
+    {'sha': 'a1', 'message': 'Fix login', 'author': 'Ana', 'additions': 10, 'deletions': 3},
+    {'sha': 'b2', 'message': 'Add dashboard', 'author': 'Ben', 'additions': 5, 'deletions': 7}
+]
+PRS = [{'number': 1, 'title': 'Dashboard', 'author': 'ben', 'state': 'open'}]
+STATS = {'full_name': 'acme/app'}
+
+class TestCommitHistory(unittest.TestCase):
+    def test_maps_every_page_and_tolerates_null_authors(self):
+        session = FakeSession([
+            _page([_node('aaaaaaaaaa', {'name': 'Ana', 'date': '2024-01-02T00:00:00Z'})], cursor='c1'),
+            _page([_node('bbbbbbbbbb', None), _node('cccccccccc', {'name': None, 'date': None})])
+        ])
+        agent = GitHubAgent(http=session)
+
+        commits = agent._fetch_daily_commits(1)
+
+        self.assertEqual(session.cursors, [None, 'c1'])
+        self.assertEqual([commit['sha'] for commit in commits], ['aaaaaaaa', 'bbbbbbbb', 'cccccccc'])
+        self.assertEqual(commits[0]['author'], 'Ana')
+        self.assertEqual(commits[0]['date'], '2024-01-02T00:00:00Z')
+        self.assertEqual(commits[1]['author'], 'Unknown')
+        self.assertIsNone(commits[1]['date'])
+        self.assertEqual(commits[2]['author'], 'Unknown')
+        self.assertEqual(commits[0]['total_changes'], 3)
+        self.assertEqual(commits[0]['files_changed'], 0)
+
+
+class TestDailyReport(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        llm_response_cache.clear()
+
+    def test_fallback_report_sums_changes(self):
+        report = GitHubAgent()._generate_fallback_report(COMMITS, PRS, STATS)
+        self.assertIn("- Total commits: 2\n", report)
+        self.assertIn("- Lines added: 15\n", report)
+        self.assertIn("- Lines deleted: 10\n", report)
+        self.assertIn("- Open PRs: 1\n", report)
+
+    async def test_prefetched_data_is_not_fetched_again(self):
+        agent = GitHubAgent()
+        agent.llm = FakeListChatModel(responses=["Daily report"])
+        fetches = mock.AsyncMock(side_effect=AssertionError("fetched again"))
+        agent.get_daily_commits = agent.get_pull_requests = agent.get_repository_stats = fetches
+
+        report = await agent.generate_daily_report(1, COMMITS, PRS, STATS)
+
+        self.assertEqual(report, "Daily report")
+        fetches.assert_not_called()
+
+    async def test_unchanged_activity_reuses_the_last_report(self):
+        agent = GitHubAgent()
+        agent.llm = FakeListChatModel(responses=["First report", "Second report"])
+
+        first = await agent.generate_daily_report(1, COMMITS, PRS, STATS)
+        llm_response_cache.clear()
+        second = await agent.generate_daily_report(1, COMMITS, PRS, STATS)
+
+        self.assertEqual(first, "First report")
+        self.assertEqual(second, "First report")
+
+class TestSnapshot(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        _github_cache._snapshots.clear()
+
+    async def test_concurrent_callers_share_one_fetch(self):
+        calls = []
+
+        def fetch(repo_full_name):
+            calls.append(repo_full_name)
+            time.sleep(0.05)
+            return _github_cache.RepoSnapshot(stats=STATS)
+
+        with mock.patch.object(_github_cache, '_fetch_snapshot', fetch):
+            snapshots = await asyncio.gather(*(_github_cache.get_snapshot("acme/app") for _ in range(3)))
+            cached = await _github_cache.get_snapshot("acme/app")
+
+        self.assertEqual(calls, ["acme/app"])
+        self.assertTrue(all(snapshot is snapshots[0] for snapshot in snapshots))
+        self.assertIs(cached, snapshots[0])
+        self.assertEqual(_github_cache._pending, {})
+
+class TestGitHubRetry(unittest.TestCase):
+    def test_retries_rate_limits_only_with_retry_after(self):
+        retry = _github_retry()
+        self.assertTrue(retry.is_retry('POST', 403, has_retry_after=True))
+        self.assertTrue(retry.is_retry('GET', 429, has_retry_after=True))
+        self.assertFalse(retry.is_retry('GET', 403))
+        self.assertFalse(retry.is_retry('GET', 500, has_retry_after=True))
+
+    def test_long_retry_after_gives_up(self):
+        retry = _github_retry()
+        short = HTTPResponse(status=403, headers={'Retry-After': '5'})
+        self.assertIsInstance(retry.increment('GET', '/repos', response=short), GitHubRetry)
+
+        long = HTTPResponse(status=403, headers={'Retry-After': '3600'})
+        with self.assertRaises(MaxRetryError):
+            retry.increment('GET', '/repos', response=long)
+
+    def test_rate_limiter_allows_a_burst_then_paces(self):
+        limiter = _RequestRateLimiter(rate=2, period=0.2)
+        with mock.patch('agents.clients.time.sleep') as sleep:
+            limiter.acquire()
+            limiter.acquire()
+            sleep.assert_not_called()
+            limiter.acquire()
+        self.assertAlmostEqual(sleep.call_args.args[0], 0.1, delta=0.02)
+
+    def test_paced_items_throttle_before_each_request(self):
+        events = []
+
+        def pages():
+            for item in range(3):
+                events.append(f"fetch {item}")
+                yield item
+
+        with mock.patch('agents.clients.GITHUB_PAGE_SIZE', 2), \
+                mock.patch('agents.clients.throttle_github_request', lambda: events.append("throttle")):
+            items = list(paced_github_items(pages(), requests_per_item=1))
+
+        self.assertEqual(items, [0, 1, 2])
+        self.assertEqual(events, [
+            "throttle", "fetch 0", "throttle",
+            "fetch 1", "throttle",
+            "throttle", "fetch 2", "throttle"
+        ])
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,164 @@
+import asyncio
+import os
+import unittest
+from unittest import mock
+
+os.environ.setdefault("GOOGLE_API_KEY", "test-key")
+
+import main
+from agents.analysis_agent import AnalysisResult
+
+ANALYSIS = AnalysisResult(
+    goals=["Ship the dashboard"],
+    constraints=["Budget"],
+    edge_cases=[],
+    follow_up_questions=[],
+    impact_analysis={},
+    recommendations=[]
+)
+
+class TestRunTogether(unittest.IsolatedAsyncioTestCase):
+    async def test_failure_cancels_siblings(self):
+        sibling_cancelled = asyncio.Event()
+
+        async def fails():
+            await asyncio.sleep(0.01)
+            raise ValueError("stage failed")
+
+        async def waits():
+            try:
+                await asyncio.sleep(10)
+            except asyncio.CancelledError:
+                sibling_cancelled.set()
+                raise
+
+        with self.assertRaisesRegex(ValueError, "stage failed"):
+            await main._run_together(fails(), waits())
+        self.assertTrue(sibling_cancelled.is_set())
+
+    async def test_all_succeed(self):
+        finished = []
+
+        async def stage(name):
+            await asyncio.sleep(0)
+            finished.append(name)
+
+        await main._run_together(stage("a"), stage("b"))
+        self.assertEqual(sorted(finished), ["a", "b"])
+
+class TestReadAhead(unittest.IsolatedAsyncioTestCase):
+    async def test_semaphore_released_before_consumer_finishes(self):
+        semaphore = asyncio.Semaphore(1)
+
+        async def source():
+            for chunk in "abc":
+                yield chunk
+
+        seen = []
+        async for chunk in main._read_ahead(source(), semaphore):
+            await asyncio.sleep(0.01)
+            seen.append((chunk, semaphore.locked()))
+
+        self.assertEqual([chunk for chunk, _ in seen], ["a", "b", "c"])
+        self.assertFalse(seen[-1][1])
+
+    async def test_source_failure_propagates(self):
+        semaphore = asyncio.Semaphore(1)
+
+        async def source():
+            yield "a"
+            raise RuntimeError("stream broke")
+
+        with self.assertRaisesRegex(RuntimeError, "stream broke"):
+            async for _ in main._read_ahead(source(), semaphore):
+                pass
+        self.assertFalse(semaphore.locked())
+
+class TestAsyncInput(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        read_fd, self.write_fd = os.pipe()
+        self.stdin = os.fdopen(read_fd)
+        main._stdin_buffer.clear()
+        patcher = mock.patch.multiple(main.sys, stdin=self.stdin, stdout=mock.Mock())
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(self.stdin.close)
+
+    def tearDown(self):
+        try:
+            os.close(self.write_fd)
+        except OSError:
+            pass
+
+    async def test_reads_lines_in_order(self):
+        os.write(self.write_fd, b"one\r\ntwo\nthr")
+        self.assertEqual(await main.ainput(), "one")
+        self.assertEqual(await main.ainput(), "two")
+        os.close(self.write_fd)
+        self.assertEqual(await main.ainput(), "thr")
+        with self.assertRaises(EOFError):
+            await main.ainput()
+
+    async def test_cancelled_prompt_does_not_consume_the_next_line(self):
+        prompt = asyncio.ensure_future(main.ainput("choice: "))
+        await asyncio.sleep(0.01)
+        prompt.cancel()
+        with self.assertRaises(asyncio.CancelledError):
+            await prompt
+
+        os.write(self.write_fd, b"5\n")
+        self.assertEqual(await main.ainput(), "5")
+
+class TestOrchestratorCaches(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        main._analysis_cache.clear()
+        main._documentation_cache.clear()
+        self.orchestrator = main.MultiAgentOrchestrator(ai_format=False)
+
+    async def run_analysis(self, answers):
+        answers = iter(answers)
+        with mock.patch.object(main, 'ainput', mock.AsyncMock(side_effect=lambda prompt="": next(answers))), \
+                mock.patch.object(main.sys, 'stdout'):
+            return await self.orchestrator.run_product_analysis(display=False)
+
+    async def test_analysis_cache_is_exact_match(self):
+        analyze = mock.AsyncMock(return_value=ANALYSIS)
+        self.orchestrator.analysis_agent.analyze_product_requirements_with_input = analyze
+
+        await self.run_analysis(["Dashboard", "", "", "", "", ""])
+        await self.run_analysis(["Dashboard", "", "", "", "", ""])
+        self.assertEqual(analyze.await_count, 1)
+
+        await self.run_analysis(["Billing", "", "", "", "", ""])
+        self.assertEqual(analyze.await_count, 2)
+
+    async def test_documentation_cache_includes_the_context(self):
+        generate = mock.AsyncMock(return_value={'prd': "PRD", 'gherkin': "Feature: x"})
+        self.orchestrator.prd_agent.generate_complete_documentation = generate
+
+        context = {'user_requirements': {'user_input': {'product_name': "Dashboard"}}}
+        await self.orchestrator.run_prd_generation(ANALYSIS, context, display=False)
+        await self.orchestrator.run_prd_generation(ANALYSIS, context, display=False)
+        self.assertEqual(generate.await_count, 1)
+
+        other = {'user_requirements': {'user_input': {'product_name': "Billing"}}}
+        await self.orchestrator.run_prd_generation(ANALYSIS, other, display=False)
+        self.assertEqual(generate.await_count, 2)
+
+class TestGitHubCollection(unittest.IsolatedAsyncioTestCase):
+    async def test_each_source_is_fetched_once(self):
+        orchestrator = main.MultiAgentOrchestrator(ai_format=False)
+        agent = orchestrator.github_agent
+        agent.get_daily_commits = mock.AsyncMock(return_value=[])
+        agent.get_pull_requests = mock.AsyncMock(return_value=[])
+        agent.get_repository_stats = mock.AsyncMock(return_value={'full_name': "acme/app"})
+
+        data = await orchestrator._collect_github_data(1)
+
+        self.assertEqual(data['report'], "No activity found for the specified period.")
+        agent.get_daily_commits.assert_awaited_once_with(1)
+        agent.get_pull_requests.assert_awaited_once_with("open")
+        agent.get_repository_stats.assert_awaited_once_with()
+
+if __name__ == "__main__":
+    unittest.main()
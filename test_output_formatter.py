@@ -1,106 +1,281 @@
 import asyncio
+import os
+import unittest
+from unittest import mock
+
+os.environ.setdefault("GOOGLE_API_KEY", "test-key")
+
 from output_formatter import format_output, create_section_header, format_bullet_list
 from datetime import datetime
+from langchain.schema import HumanMessage, SystemMessage
+from langchain_community.chat_models.fake import FakeListChatModel
+import output_formatter
+from agents.cache import llm_response_cache
+from agents.rate_limit import ainvoke_with_retry, astream_with_retry
 
-async def test_output_formatter():
-    """Test the output formatter with sample data"""
-    
-    print("🧪 Testing Output Formatter\n")
-    
-    # Test GitHub report formatting
-    github_data = {
-        'report': 'Daily GitHub activity shows 5 commits with significant changes to the authentication system and database migrations. Pull requests are pending review for the new user dashboard feature.',
-        'commits': [
-            {'sha': 'abc123', 'message': 'Fix authentication bug', 'author': 'John Doe', 'additions': 45, 'deletions': 12},
-            {'sha': 'def456', 'message': 'Add user dashboard', 'author': 'Jane Smith', 'additions': 120, 'deletions': 8},
-            {'sha': 'ghi789', 'message': 'Update database schema', 'author': 'Bob Wilson', 'additions': 67, 'deletions': 23}
-        ],
-        'pull_requests': [
-            {'number': 42, 'title': 'Feature: New user dashboard', 'author': 'jane_smith', 'state': 'open'},
-            {'number': 43, 'title': 'Fix: Authentication issues', 'author': 'john_doe', 'state': 'open'}
-        ],
-        'repository_stats': {
-            'full_name': 'company/awesome-app',
-            'stars': 156,
-            'forks': 23,
-            'open_issues': 8
-        }
-    }
-    
-    print("📊 BEFORE (Verbose GitHub Data):")
-    print(f"Report: {github_data['report']}")
-    print(f"Commits: {len(github_data['commits'])} commits with detailed info")
-    print(f"PRs: {len(github_data['pull_requests'])} pull requests")
-    print(f"Stats: {github_data['repository_stats']}")
-    
-    print("\n📊 AFTER (Minimized GitHub Output):")
-    github_formatted = await format_output('github', github_data)
-    print(github_formatted)
-    
-    print("\n" + "="*60 + "\n")
-    
-    # Test Analysis formatting
-    analysis_data = {
-        'analysis_result': {
-            'goals': [
-                'Improve user authentication system security',
-                'Enhance user dashboard functionality', 
-                'Optimize database performance',
-                'Implement real-time notifications',
-                'Add mobile responsive design'
-            ],
-            'constraints': [
-                'Limited development budget of $50k',
-                'Must maintain backward compatibility',
-                'Performance cannot degrade more than 5%',
-                'Security compliance requirements'
+class TestOutputFormatter(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        llm_response_cache.clear()
+        fake_llm = FakeListChatModel(responses=["GitHub summary", "Analysis summary"])
+        patcher = mock.patch.object(output_formatter.get_formatter(), 'llm', fake_llm)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+    
+    async def test_output_formatter(self):
+        """Test the output formatter with sample data"""
+        
+        print("🧪 Testing Output Formatter\n")
+    
+        # Test GitHub report formatting
+        github_data = {
+            'report': 'Daily GitHub activity shows 5 commits with significant changes to the authentication system and database migrations. Pull requests are pending review for the new user dashboard feature.',
+            'commits': [
+                {'sha': 'abc123', 'message': 'Fix authentication bug', 'author': 'John Doe', 'additions': 45, 'deletions': 12},
+                {'sha': 'def456', 'message': 'Add user dashboard', 'author': 'Jane Smith', 'additions': 120, 'deletions': 8},
+                {'sha': 'ghi789', 'message': 'Update database schema', 'author': 'Bob Wilson', 'additions': 67, 'deletions': 23}
             ],
-            'recommendations': [
-                'Implement OAuth 2.0 for authentication',
-                'Use React for dashboard components',
-                'Optimize database queries with indexing',
-                'Add comprehensive error handling',
-                'Conduct security audit before deployment'
+            'pull_requests': [
+                {'number': 42, 'title': 'Feature: New user dashboard', 'author': 'jane_smith', 'state': 'open'},
+                {'number': 43, 'title': 'Fix: Authentication issues', 'author': 'john_doe', 'state': 'open'}
             ],
-            'impact_analysis': {
-                'growth_potential': 'High - 30% user engagement increase expected',
-                'revenue_impact': 'Positive - $200k annual revenue increase',
-                'user_experience': 'Significantly improved',
-                'technical_debt': 'Reduced by 40%'
+            'repository_stats': {
+                'full_name': 'company/awesome-app',
+                'stars': 156,
+                'forks': 23,
+                'open_issues': 8
             }
-        },
-        'status': 'success'
-    }
+        }
+    
+        print("📊 BEFORE (Verbose GitHub Data):")
+        print(f"Report: {github_data['report']}")
+        print(f"Commits: {len(github_data['commits'])} commits with detailed info")
+        print(f"PRs: {len(github_data['pull_requests'])} pull requests")
+        print(f"Stats: {github_data['repository_stats']}")
+    
+        print("\n📊 AFTER (Minimized GitHub Output):")
+        github_formatted = await format_output('github', github_data)
+        print(github_formatted)
+        self.assertEqual(github_formatted, "GitHub summary")
+    
+        print("\n" + "="*60 + "\n")
+    
+        # Test Analysis formatting
+        analysis_data = {
+            'analysis_result': {
+                'goals': [
+                    'Improve user authentication system security',
+                    'Enhance user dashboard functionality', 
+                    'Optimize database performance',
+                    'Implement real-time notifications',
+                    'Add mobile responsive design'
+                ],
+                'constraints': [
+                    'Limited development budget of $50k',
+                    'Must maintain backward compatibility',
+                    'Performance cannot degrade more than 5%',
+                    'Security compliance requirements'
+                ],
+                'recommendations': [
+                    'Implement OAuth 2.0 for authentication',
+                    'Use React for dashboard components',
+                    'Optimize database queries with indexing',
+                    'Add comprehensive error handling',
+                    'Conduct security audit before deployment'
+                ],
+                'impact_analysis': {
+                    'growth_potential': 'High - 30% user engagement increase expected',
+                    'revenue_impact': 'Positive - $200k annual revenue increase',
+                    'user_experience': 'Significantly improved',
+                    'technical_debt': 'Reduced by 40%'
+                }
+            },
+            'status': 'success'
+        }
+    
+        print("🎯 BEFORE (Verbose Analysis Data):")
+        print(f"Goals: {len(analysis_data['analysis_result']['goals'])} detailed goals")
+        print(f"Constraints: {len(analysis_data['analysis_result']['constraints'])} constraints")
+        print(f"Recommendations: {len(analysis_data['analysis_result']['recommendations'])} recommendations")
+    
+        print("\n🎯 AFTER (Minimized Analysis Output):")
+        analysis_formatted = await format_output('analysis', analysis_data)
+        print(analysis_formatted)
+        self.assertEqual(analysis_formatted, "Analysis summary")
     
-    print("🎯 BEFORE (Verbose Analysis Data):")
-    print(f"Goals: {len(analysis_data['analysis_result']['goals'])} detailed goals")
-    print(f"Constraints: {len(analysis_data['analysis_result']['constraints'])} constraints")
-    print(f"Recommendations: {len(analysis_data['analysis_result']['recommendations'])} recommendations")
+        print("\n" + "="*60 + "\n")
     
-    print("\n🎯 AFTER (Minimized Analysis Output):")
-    analysis_formatted = await format_output('analysis', analysis_data)
-    print(analysis_formatted)
+        # Test utility functions
+        print("🛠️ Testing Utility Functions:")
     
-    print("\n" + "="*60 + "\n")
+        print(create_section_header("Sample Section", "🔧"))
     
-    # Test utility functions
-    print("🛠️ Testing Utility Functions:")
+        sample_items = [
+            "First important item with lots of details",
+            "Second critical point that needs attention", 
+            "Third recommendation for improvement",
+            "Fourth suggestion for optimization",
+            "Fifth item that might be less critical",
+            "Sixth item that exceeds the limit"
+        ]
     
-    print(create_section_header("Sample Section", "🔧"))
+        print("Formatted bullet list (max 4 items):")
+        print(format_bullet_list(sample_items, max_items=4))
+    
+        print("\n✅ Output Formatter Test Completed!")
+
+class FlakyStream:
+    """astream() that times out on its first call, then streams the given text"""
+    
+    def __init__(self, text):
+        self.text = text
+        self.calls = 0
+    
+    def astream(self, inputs):
+        self.calls += 1
+        calls = self.calls
+        
+        async def chunks():
+            if calls == 1:
+                raise TimeoutError("slow start")
+            for char in self.text:
+                yield mock.Mock(content=char)
+        return chunks()
+
+class TestFormatterCaching(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        llm_response_cache.clear()
+        self.formatter = output_formatter.OutputFormatter()
+    
+    async def test_cache_is_exact_match_only(self):
+        self.formatter.llm = FakeListChatModel(responses=["3 commits", "4 commits"])
+        
+        first = await self.formatter.format_github_report({'report': 'r', 'commits_count': 3})
+        repeat = await self.formatter.format_github_report({'report': 'r', 'commits_count': 3})
+        changed = await self.formatter.format_github_report({'report': 'r', 'commits_count': 4})
+        
+        self.assertEqual((first, repeat, changed), ("3 commits", "3 commits", "4 commits"))
+    
+    async def test_stream_retries_and_caches(self):
+        self.formatter.llm = FlakyStream("Summary")
+        with mock.patch('agents.rate_limit.wait_exponential_jitter.__call__', return_value=0):
+            chunks = [chunk async for chunk in self.formatter.stream('prd', {'status': 'success'})]
+        
+        self.assertEqual("".join(chunks), "Summary")
+        self.assertEqual(self.formatter.llm.calls, 2)
+        cached = [chunk async for chunk in self.formatter.stream('prd', {'status': 'success'})]
+        self.assertEqual(cached, ["Summary"])
+
+    async def test_prompts_use_system_and_human_messages(self):
+        self.formatter.llm = mock.Mock()
+        self.formatter.llm.ainvoke = mock.AsyncMock(return_value=mock.Mock(content="Summary"))
+        
+        await self.formatter._complete("Be brief", "Data")
+        
+        [messages] = self.formatter.llm.ainvoke.await_args.args
+        self.assertEqual(messages, [SystemMessage(content="Be brief"), HumanMessage(content="Data")])
+
+class TestBatchFormatting(unittest.IsolatedAsyncioTestCase):
+    SECTIONS = {'prd': {'status': 'success'}, 'workflow': {'status': 'completed'}}
+    
+    def setUp(self):
+        llm_response_cache.clear()
+        self.formatter = output_formatter.OutputFormatter()
+        patcher = mock.patch.object(output_formatter, 'format_output', mock.AsyncMock(
+            side_effect=lambda output_type, data, llm_semaphore=None: f"<{output_type}>"
+        ))
+        self.format_output = patcher.start()
+        self.addCleanup(patcher.stop)
+    
+    async def test_bad_batch_reply_is_not_cached(self):
+        self.formatter.llm = FakeListChatModel(responses=[
+            "not json",
+            '```json\n{"prd": "PRD summary", "workflow": "Workflow summary"}\n```'
+        ])
+        
+        first = await self.formatter.format_all(self.SECTIONS)
+        self.assertEqual(first, {'prd': '<prd>', 'workflow': '<workflow>'})
+        self.assertEqual(len(llm_response_cache), 0)
+        
+        second = await self.formatter.format_all(self.SECTIONS)
+        third = await self.formatter.format_all(self.SECTIONS)
+        self.assertEqual(second, {'prd': 'PRD summary', 'workflow': 'Workflow summary'})
+        self.assertEqual(third, second)
+        self.assertEqual(len(llm_response_cache), 1)
+    
+    async def test_partial_batch_reply_falls_back_per_section(self):
+        self.formatter.llm = FakeListChatModel(responses=['{"prd": "PRD summary", "workflow": 3}'])
+        
+        formatted = await self.formatter.format_all(self.SECTIONS)
+        
+        self.assertEqual(formatted, {'prd': 'PRD summary', 'workflow': '<workflow>'})
+        self.assertEqual(len(llm_response_cache), 0)
+    
+    async def test_each_llm_call_takes_its_own_slot(self):
+        semaphore = asyncio.Semaphore(1)
+        held = []
+        
+        async def complete(system_prompt, human_prompt):
+            held.append(('batch', semaphore.locked()))
+            return "not json"
+        
+        async def fallback(output_type, data, llm_semaphore=None):
+            # The batch's slot must be released before the fallbacks queue for their own
+            held.append((output_type, semaphore.locked()))
+            async with llm_semaphore:
+                return f"<{output_type}>"
+        
+        self.formatter._complete = complete
+        self.format_output.side_effect = fallback
+        
+        await self.formatter.format_all(self.SECTIONS, semaphore)
+        
+        self.assertEqual(held, [('batch', True), ('prd', False), ('workflow', False)])
+
+class TestRetryPolicy(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        patcher = mock.patch('agents.rate_limit.wait_exponential_jitter.__call__', return_value=0)
+        patcher.start()
+        self.addCleanup(patcher.stop)
     
-    sample_items = [
-        "First important item with lots of details",
-        "Second critical point that needs attention", 
-        "Third recommendation for improvement",
-        "Fourth suggestion for optimization",
-        "Fifth item that might be less critical",
-        "Sixth item that exceeds the limit"
-    ]
+    async def test_only_timeouts_are_retried(self):
+        runnable = mock.Mock()
+        runnable.ainvoke = mock.AsyncMock(side_effect=[TimeoutError(), "done"])
+        self.assertEqual(await ainvoke_with_retry(runnable, None), "done")
+        
+        runnable.ainvoke = mock.AsyncMock(side_effect=ValueError("bad request"))
+        with self.assertRaises(ValueError):
+            await ainvoke_with_retry(runnable, None)
+        self.assertEqual(runnable.ainvoke.await_count, 1)
     
-    print("Formatted bullet list (max 4 items):")
-    print(format_bullet_list(sample_items, max_items=4))
+    async def test_each_attempt_is_timed_out(self):
+        async def hangs_once(inputs):
+            if runnable.ainvoke.await_count == 1:
+                await asyncio.sleep(10)
+            return "done"
+        
+        runnable = mock.Mock()
+        runnable.ainvoke = mock.AsyncMock(side_effect=hangs_once)
+        with mock.patch('agents.rate_limit.settings', mock.Mock(llm_timeout_seconds=0.05)):
+            self.assertEqual(await ainvoke_with_retry(runnable, None), "done")
+        self.assertEqual(runnable.ainvoke.await_count, 2)
     
-    print("\n✅ Output Formatter Test Completed!")
+    async def test_stream_failure_after_first_chunk_propagates(self):
+        class Broken:
+            calls = 0
+            
+            def astream(self, inputs):
+                Broken.calls += 1
+                
+                async def chunks():
+                    yield mock.Mock(content="a")
+                    raise TimeoutError("stalled")
+                return chunks()
+        
+        received = []
+        with self.assertRaises(TimeoutError):
+            async for chunk in astream_with_retry(Broken(), None):
+                received.append(chunk.content)
+        self.assertEqual((received, Broken.calls), (["a"], 1))
 
 if __name__ == "__main__":
-    asyncio.run(test_output_formatter())
+    unittest.main()
@@ -0,0 +1,226 @@
+import os
+import unittest
+
+os.environ.setdefault("GOOGLE_API_KEY", "test-key")
+
+import orjson
+from langchain.schema import HumanMessage
+from langchain_community.chat_models.fake import FakeListChatModel
+from agents.analysis_agent import AnalysisResult
+from agents.cache import llm_response_cache
+from agents.prd_agent import (
+    CONTEXT_ITEMS_LIMIT,
+    GherkinScenario,
+    PRDAgent,
+    PRDDocument,
+    _LenientPRDParser,
+    _PRD_HEADER_RE,
+    _summarize_project_context,
+    _tokenize_gherkin,
+)
+from agents.clients import with_structured_output
+
+ANALYSIS = AnalysisResult(
+    goals=["Ship the dashboard"],
+    constraints=["Budget"],
+    edge_cases=["Offline users"],
+    follow_up_questions=["Who signs off?"],
+    impact_analysis={"growth_potential": "High"},
+    recommendations=["Start with a beta"]
+)
+
+PRD_MARKDOWN = """# Product Title: Team Dashboard
+
+## 1. Overview
+A dashboard for teams.
+It shows activity.
+
+## 2. Objectives
+- Reduce status meetings
+- Surface blockers
+
+## 3. Success Metrics
+* Weekly active teams
+
+**Non-Functional Requirements**
+- Loads in under 2s
+
+## Functional Requirements
+- Show commits
+
+## Timeline
+Q3 delivery
+
+## Risks and Mitigation
+• Low adoption
+"""
+
+GHERKIN_TEXT = """Feature: Login
+  Background: Given the app is running
+
+  Scenario: Valid password
+    Given I am on the login page
+    When I submit valid credentials
+    Then I see my dashboard
+
+  Scenario: Wrong password
+    Given I am on the login page
+    When I submit a wrong password
+    Then I see an error
+    But I stay on the login page
+
+Feature: Logout
+  Scenario: Sign out
+    Given I am signed in
+    When I click sign out
+    Then I see the login page
+"""
+
+class TestPRDHeaderRegex(unittest.TestCase):
+    def section(self, line):
+        match = _PRD_HEADER_RE.match(line)
+        return match.lastgroup if match else None
+
+    def test_title(self):
+        match = _PRD_HEADER_RE.match("# Product Title: Team Dashboard")
+        self.assertEqual(match.lastgroup, 'title')
+        self.assertEqual(match.group('title'), "Product Title: Team Dashboard")
+
+    def test_section_headers(self):
+        self.assertEqual(self.section("## 3. Success Metrics"), 'success_metrics')
+        self.assertEqual(self.section("**Risks and Mitigation**"), 'risks')
+        self.assertEqual(self.section("### User Story"), 'user_stories')
+        self.assertEqual(self.section("## Non-Functional Requirements"), 'non_functional_requirements')
+        self.assertEqual(self.section("## Functional Requirements"), 'functional_requirements')
+
+    def test_plain_lines_are_not_headers(self):
+        self.assertIsNone(self.section("- Objectives are listed below"))
+        self.assertIsNone(self.section("Overview of the product"))
+
+class TestLenientPRDParser(unittest.TestCase):
+    def parse(self, text):
+        return _LenientPRDParser(ANALYSIS).parse(text)
+
+    def test_parses_sections(self):
+        prd = self.parse(PRD_MARKDOWN)
+        self.assertEqual(prd.title, "Product Title: Team Dashboard")
+        self.assertEqual(prd.overview, "A dashboard for teams. It shows activity.")
+        self.assertEqual(prd.objectives, ["Reduce status meetings", "Surface blockers"])
+        self.assertEqual(prd.success_metrics, ["Weekly active teams"])
+        self.assertEqual(prd.non_functional_requirements, ["Loads in under 2s"])
+        self.assertEqual(prd.functional_requirements, ["Show commits"])
+        self.assertEqual(prd.timeline, "Q3 delivery")
+        self.assertEqual(prd.risks, ["Low adoption"])
+
+    def test_missing_sections_fall_back_to_the_analysis(self):
+        prd = self.parse("## Overview\nJust an overview")
+        self.assertEqual(prd.overview, "Just an overview")
+        self.assertEqual(prd.objectives, ANALYSIS.goals)
+        self.assertEqual(prd.constraints, ANALYSIS.constraints)
+        self.assertEqual(prd.risks, ANALYSIS.edge_cases)
+
+class TestGherkin(unittest.TestCase):
+    def setUp(self):
+        self.agent = PRDAgent()
+
+    def test_tokenize(self):
+        tokens = list(_tokenize_gherkin("Feature: A\n  Background: Given x\n Scenario: B\n  And y\nnoise"))
+        self.assertEqual(tokens, [('feature', 'A'), ('background', 'Given x'), ('scenario', 'B'), ('step', 'And y')])
+
+    def test_parse_response(self):
+        features = self.agent._parse_gherkin_response(GHERKIN_TEXT)
+        self.assertEqual([feature.feature for feature in features], ["Login", "Logout"])
+        self.assertEqual(features[0].background, "Given the app is running")
+        self.assertIsNone(features[1].background)
+        self.assertEqual([scenario['name'] for scenario in features[0].scenarios], ["Valid password", "Wrong password"])
+        self.assertEqual(features[0].scenarios[1]['steps'][-1], "But I stay on the login page")
+
+    def test_parse_response_without_features_falls_back(self):
+        features = self.agent._parse_gherkin_response("no gherkin here")
+        self.assertEqual(features[0].feature, "Core Functionality")
+
+    def test_format_scenarios(self):
+        scenarios = [
+            GherkinScenario(feature="Login", background="Given the app is running",
+                            scenarios=[{'name': "Valid", 'steps': ["Given a user", "Then it works"]}]),
+            GherkinScenario(feature="Logout", background=None,
+                            scenarios=[{'name': "Sign out", 'steps': ["When I leave"]}])
+        ]
+        self.assertEqual(
+            self.agent.format_gherkin_scenarios(scenarios),
+            "Feature: Login\n"
+            "  Background: Given the app is running\n"
+            "\n  Scenario: Valid\n"
+            "    Given a user\n"
+            "    Then it works\n"
+            "\n"
+            "Feature: Logout\n"
+            "\n  Scenario: Sign out\n"
+            "    When I leave\n"
+        )
+
+class TestFallbacks(unittest.TestCase):
+    def setUp(self):
+        self.agent = PRDAgent()
+
+    def test_fallback_prd_is_independent(self):
+        prd = self.agent._create_fallback_prd(ANALYSIS)
+        prd.objectives.append("Mutated")
+        prd.success_metrics.append("Mutated")
+
+        self.assertEqual(ANALYSIS.goals, ["Ship the dashboard"])
+        self.assertNotIn("Mutated", self.agent._create_fallback_prd(ANALYSIS).success_metrics)
+
+    def test_fallback_gherkin_is_independent(self):
+        scenarios = self.agent._create_fallback_gherkin_scenarios()
+        scenarios[0].scenarios[0]['steps'].append("Mutated")
+
+        fresh = self.agent._create_fallback_gherkin_scenarios()
+        self.assertIsNot(fresh[0], scenarios[0])
+        self.assertNotIn("Mutated", fresh[0].scenarios[0]['steps'])
+
+class TestPRDRendering(unittest.TestCase):
+    def test_bullets_render_without_blank_lines(self):
+        prd = PRDAgent()._create_fallback_prd(ANALYSIS).model_copy(update={'objectives': ["One", "Two"]})
+        rendered = PRDAgent().format_prd_document(prd)
+        self.assertIn("## Objectives\n- One\n- Two\n\n## Success Metrics\n", rendered)
+        self.assertIn("## Timeline\nDevelopment timeline to be determined\n", rendered)
+
+class TestProjectContext(unittest.TestCase):
+    def test_github_data_is_bounded_and_sorted(self):
+        context = {
+            'user_requirements': {'user_input': {'product_name': "Dashboard"}},
+            'github_data': {
+                'report': "x" * 10000,
+                'commits': [{'message': f"Commit {i}\n\nLong body"} for i in range(50)],
+                'pull_requests': [{'title': f"PR {i}"} for i in range(20)],
+                'repository_stats': {'full_name': "acme/app"}
+            }
+        }
+        summary = orjson.loads(_summarize_project_context(context))
+        activity = summary['github_activity']
+        self.assertEqual(activity['commits_count'], 50)
+        self.assertEqual(activity['recent_commits'], [f"Commit {i}" for i in range(CONTEXT_ITEMS_LIMIT)])
+        self.assertEqual(len(activity['open_pull_requests']), CONTEXT_ITEMS_LIMIT)
+        self.assertEqual(activity['repository'], "acme/app")
+        self.assertNotIn('github_data', summary)
+        self.assertEqual(list(summary), sorted(summary))
+
+class TestStructuredOutput(unittest.IsolatedAsyncioTestCase):
+    async def test_parses_schema_reply(self):
+        reply = orjson.dumps(PRDAgent()._create_fallback_prd(ANALYSIS).model_dump()).decode()
+        chain = with_structured_output(FakeListChatModel(responses=[reply]), PRDDocument)
+        prd = await chain.ainvoke([HumanMessage(content="Write a PRD")])
+        self.assertIsInstance(prd, PRDDocument)
+        self.assertEqual(prd.objectives, ANALYSIS.goals)
+
+    async def test_markdown_reply_is_salvaged(self):
+        llm_response_cache.clear()
+        agent = PRDAgent()
+        agent.structured_llm = with_structured_output(FakeListChatModel(responses=[PRD_MARKDOWN]), PRDDocument)
+        prd = await agent.generate_prd(ANALYSIS)
+        self.assertEqual(prd.title, "Product Title: Team Dashboard")
+        self.assertEqual(prd.objectives, ["Reduce status meetings", "Surface blockers"])
+
+if __name__ == "__main__":
+    unittest.main()